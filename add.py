@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
-from collections import defaultdict
-from datetime import datetime
 from glob import glob
 import os
 import sys
 
-from todotxt import TODOFile, DATE_FMT, todo_from_line
+from todotxt import TODOFile, todo_from_line
+from todotxt.client import request
 
 if __name__ == '__main__':
     # todo.sh usage:
@@ -21,6 +20,11 @@ if __name__ == '__main__':
     parser.add_argument('-f', dest='fnpat',
                         default="todo.txt",
                         help="filename prefix to save to")
+    parser.add_argument('--journal', action='store_true',
+                        default=bool(os.environ.get('TODOTXT_JOURNAL')),
+                        help="Record the todo in the directory's journal "
+                        "instead of writing the file (default if "
+                        "$TODOTXT_JOURNAL is set)")
     parser.add_argument("text", nargs=argparse.REMAINDER,
                         help='text of new todo')
 
@@ -36,9 +40,27 @@ if __name__ == '__main__':
         print("Too many matches for -f: {}".format(", ".join(fnl)))
         sys.exit(1)
     
-    todo_file = TODOFile(fnl[0])
+    text = " ".join(opts.text)
+    if opts.journal:
+        # only imported here, it isn't needed when writing directly
+        from todotxt.journal import Journal
+        t = todo_from_line(text)
+        t.set_created_now()
+        journal = Journal(opts.dir)
+        journal.add(os.path.basename(fnl[0]), t)
+        journal.maybe_compact()
+        sys.exit()
 
-    t = todo_from_line(" ".join(opts.text))
-    t.set_created_now()
-    todo_file.add_todo(t)
-    todo_file.save()
+    reply = request(opts.dir, {'op': 'add', 'file': os.path.basename(fnl[0]),
+                               'text': text, 'created_now': True})
+    if reply is None:
+        # no daemon running. appending under the journal's lock keeps a
+        # compaction from saving over the new line
+        from todotxt.journal import locked
+        t = todo_from_line(text)
+        t.set_created_now()
+        with locked(opts.dir):
+            TODOFile.append_to(fnl[0], [t])
+    elif not reply['ok']:
+        print("Error: {}".format(reply['error']))
+        sys.exit(1)
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
-from glob import glob
 import os
 import sys
 
-from todotxt import TODOFile, todo_from_line
+from todotxt import journal
+from todotxt.shards import split_done
+from todotxt.store import TodoStore
 
 
 if __name__ == '__main__':
@@ -18,32 +19,30 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='todotxt archive script')
     parser.add_argument('--dir', default=os.environ.get('TODO_DIR', '.'),
                         help="Directory to look for todo.txt files")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of processes to parse files with "
+                        "(0 for one per CPU)")
+    parser.add_argument('--split-done', action='store_true',
+                        help="First move done.txt into monthly shards in "
+                        "done/, which are archived to from then on")
 
     opts = parser.parse_args()
-    print("Archiving in {}".format(opts.dir))
-    todo_files = glob(opts.dir + "/*.txt")
-    done_file = TODOFile(os.path.join(opts.dir, "done.txt"))
-    for fn in todo_files:
-        bfn = os.path.basename(fn)
-        if bfn == "done.txt":
-            continue
-        f = TODOFile(fn)
-        print("{:<18}: ".format(bfn), end="")
-        archived = 0
-        to_delete = []
-        for todo in f.get_todos():
-            if not todo.done:
-                continue
-            done_file.add_todo(todo)
-            to_delete.append(todo)
-            archived += 1
-        for deltodo in to_delete:
-            f.delete_todo(deltodo)
-
+    # applies changes still waiting in the journal first, and keeps
+    # compaction from writing the files while they're being archived
+    with journal.locked(opts.dir):
+        if opts.split_done:
+            shards = split_done(opts.dir)
+            print("Split done.txt into {} shards in {}".format(
+                len(shards.shards()), shards.shard_dir))
+        print("Archiving in {}".format(opts.dir))
+        store = TodoStore(opts.dir)
+        if opts.jobs != 1:
+            store.preload([bfn for bfn in store if bfn != "done.txt"],
+                          opts.jobs or None)
         try:
-            done_file.save()
-            f.save()
-        except:
+            archived = store.archive_done("done.txt")
+        except OSError:
             print("error saving.")
             sys.exit(1)
-        print("archived {} todos.".format(archived))
+    for bfn, n in archived.items():
+        print("{:<18}: archived {} todos.".format(bfn, n))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from todotxt import TODOFile, todo_from_line
+from todotxt.analytics import DoneColumns
+from todotxt.corpus import generate
+from todotxt.project import ProjectFile
+from todotxt.store import TodoStore
+
+
+def best_of(repeat, fn, setup=None, teardown=None):
+    """returns the best time in seconds of repeat runs of fn(setup()),
+    not counting setup, or teardown(setup()) after each run"""
+    times = []
+    for i in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+        if teardown:
+            teardown(arg)
+    return min(times)
+
+
+def copy_dir(src, tmp):
+    "returns a fresh copy of the todo dir src inside tmp"
+    dst = tempfile.mkdtemp(dir=tmp)
+    for fn in os.listdir(src):
+        shutil.copy(os.path.join(src, fn), dst)
+    return dst
+
+
+def remove_copy(path):
+    "removes a copy made by copy_dir, given it or a file in it"
+    if not os.path.isdir(path):
+        path = os.path.dirname(path)
+    shutil.rmtree(path)
+
+
+def edit_and_save(f):
+    "changes about 1% of f's todos, deletes one near the start and saves"
+    todos = f.get_todos()
+    for t in todos[::100]:
+        t.priority = "B" if t.priority != "B" else "C"
+    if todos:
+        f.delete_todo(todos[len(todos) // 10])
+    f.save()
+
+
+def run(corpus, repeat, tmp):
+    "returns {benchmark name: seconds} for the todo dir corpus"
+    todo_fn = os.path.join(corpus, "todo.txt")
+    done_fn = os.path.join(corpus, "done.txt")
+    with open(todo_fn) as f:
+        lines = f.read().splitlines()
+    loaded = TODOFile(todo_fn)
+
+    def fresh_file():
+        return TODOFile(os.path.join(copy_dir(corpus, tmp), "todo.txt"))
+
+    return {
+        'todo_from_line': best_of(
+            repeat, lambda a: [todo_from_line(l) for l in lines]),
+        'TODO.__str__': best_of(
+            repeat, lambda todos: [str(t) for t in todos],
+            lambda: [todo_from_line(l) for l in lines]),
+        'TODOFile load': best_of(repeat, lambda a: TODOFile(todo_fn)),
+        'TODOFile save': best_of(repeat, edit_and_save, fresh_file,
+                                 lambda f: remove_copy(f.filename)),
+        '_recalc': best_of(
+            repeat, lambda a: (loaded._recalc(), loaded._indexes())),
+        # sort keys are cached on the todos, so each run sorts fresh ones
+        'review sort': best_of(
+            repeat, sorted, lambda: TODOFile(todo_fn).get_todos()),
+        'archive': best_of(
+            repeat, lambda d: TodoStore(d).archive_done(),
+            lambda: copy_dir(corpus, tmp), remove_copy),
+        'recap': best_of(
+            repeat, lambda a: TODOFile.tail_done(done_fn, 7)),
+        'recap --stats': best_of(
+            repeat, lambda a: DoneColumns.from_todos(
+                TODOFile.iter_todos(done_fn)).per_day()),
+        'ProjectFile': best_of(
+            repeat, lambda d: ProjectFile(os.path.join(d, "projects")),
+            lambda: copy_dir(corpus, tmp), remove_copy),
+    }
+
+
+if __name__ == '__main__':
+    # todo.sh usage:
+    if len(sys.argv) > 1 and sys.argv[1] == 'usage':
+        print("USAGE: bench [--lines 1000,10000] [-o results.json]")
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='todotxt benchmarks on '
+                                     'generated todo directories')
+    parser.add_argument('--lines', default="1000,10000,100000",
+                        help="Comma separated corpus sizes, in lines")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the corpus generator")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="Runs of each benchmark, the best one counts")
+    parser.add_argument('-o', dest='out',
+                        help="Write the results to this JSON file")
+    parser.add_argument('--compare',
+                        help="JSON results of an earlier run to compare to")
+    opts = parser.parse_args()
+
+    # benchmark parsing, not the cache
+    os.environ.pop('TODOTXT_CACHE_DIR', None)
+    old = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            old = json.load(f)['results']
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [int(n) for n in opts.lines.split(",")]:
+            corpus = os.path.join(tmp, "corpus-{}".format(n))
+            generate(corpus, n, opts.seed)
+            results[str(n)] = run(corpus, opts.repeat, tmp)
+            print("{} lines".format(n))
+            for name, secs in results[str(n)].items():
+                s = "  {:<16} {:>10.2f} ms".format(name, secs * 1000)
+                if old and name in old.get(str(n), {}):
+                    s += "  {:>6.2f}x".format(secs / old[str(n)][name])
+                print(s)
+            sys.stdout.flush()
+            shutil.rmtree(corpus)
+
+    if opts.out:
+        with open(opts.out, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'seed': opts.seed, 'repeat': opts.repeat,
+                       'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       'results': results}, f, indent=1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from todotxt.client import request, socket_path
+from todotxt.daemon import TodoDaemon, running
+
+if __name__ == '__main__':
+    # todo.sh usage:
+    if len(sys.argv) > 1 and sys.argv[1] == 'usage':
+        print("USAGE: daemon [--status|--stop]")
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='todotxt daemon: keeps the '
+                                     'todo files parsed for add, do and query')
+    parser.add_argument('--dir', default=os.environ.get('TODO_DIR', '.'),
+                        help="Directory to look for todo.txt files")
+    parser.add_argument('--status', action='store_true',
+                        help="Show whether a daemon is running")
+    parser.add_argument('--stop', action='store_true',
+                        help="Stop the running daemon")
+    opts = parser.parse_args()
+
+    pid = running(opts.dir)
+    if opts.status:
+        if pid is None:
+            print("not running")
+            sys.exit(1)
+        print("running as pid {} on {}".format(pid, socket_path(opts.dir)))
+    elif opts.stop:
+        if pid is None:
+            print("not running")
+            sys.exit(1)
+        request(opts.dir, {'op': 'stop'})
+    elif pid is not None:
+        print("already running as pid {}".format(pid))
+        sys.exit(1)
+    else:
+        server = TodoDaemon(opts.dir)
+        print("serving {} on {}".format(opts.dir, server.path))
+        sys.stdout.flush()
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
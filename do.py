@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
-from collections import defaultdict
-from datetime import datetime
+from contextlib import nullcontext
 import os
 import sys
 
-from todotxt import TODOFile, DATE_FMT
+from todotxt import TODOFile, todo_from_line
+from todotxt.client import request
+from todotxt.journal import Journal, locked
 
 if __name__ == '__main__':
     # todo.sh usage:
@@ -20,26 +21,73 @@ if __name__ == '__main__':
     parser.add_argument("N", type=int, nargs='*',
                         metavar='line number(s)',
                         help="line numbers of todos to edit (starting at 1)")
+    parser.add_argument('--journal', action='store_true',
+                        default=bool(os.environ.get('TODOTXT_JOURNAL')),
+                        help="Record the changes in the directory's journal "
+                        "instead of writing the file (default if "
+                        "$TODOTXT_JOURNAL is set)")
 
     opts = parser.parse_args()
 
-    todo_file = TODOFile(os.path.join(opts.dir, "todo.txt"))
-
-    todos = todo_file.get_todos()
-
-    for N in opts.N:
-        num = N - 1
-        if num > len(todos):
-            print("Error: there are only {} todos in {}".format(len(todos),
-                                                                filename))
-            print("they are: \n{}".format(list(map(str, f.get_todos()))))
+    reply = None
+    if not opts.journal:
+        reply = request(opts.dir, {'op': 'do', 'file': "todo.txt",
+                                   'handles': opts.N})
+    if reply is not None:
+        if 'missing' in reply:
+            print("Error: no todo on line {} of {}".format(
+                reply['missing'], os.path.join(opts.dir, "todo.txt")))
+            print("they are: \n{}".format(reply['todos']))
             sys.exit(1)
-
-        t = todos[num]
-        if t.done:
+        elif 'already_done' in reply:
             print("Already done!")
             sys.exit()
+        elif not reply['ok']:
+            print("Error: {}".format(reply['error']))
+            sys.exit(1)
+        for line in reply['done']:
+            print("done: {}".format(line))
+        sys.exit()
+
+    # writing todo.txt directly, the journal's lock is held from reading
+    # it to saving it, see todotxt.journal.locked
+    with nullcontext() if opts.journal else locked(opts.dir):
+        todo_file = TODOFile(os.path.join(opts.dir, "todo.txt"))
+        if opts.journal:
+            journal = Journal(opts.dir)
+            records = [r for r in journal.pending()
+                       if r['file'] == "todo.txt"]
+            # todos added in the journal but not in todo.txt yet get the
+            # line numbers they'll have there
+            for r in records:
+                if r['op'] == 'add':
+                    todo_file.add_todo(todo_from_line(r['line']))
+            # todos marked done in the journal but not in todo.txt yet
+            pending = {r['line'] for r in records if r['op'] == 'replace'}
+        replaced = []
+
+        for N in opts.N:
+            try:
+                t = todo_file.get_todo(N)
+            except KeyError:
+                print("Error: no todo on line {} of {}".format(
+                    N, todo_file.filename))
+                print("they are: \n{}".format(
+                    list(map(str, todo_file.get_todos()))))
+                sys.exit(1)
+
+            if t.done or opts.journal and str(t) in pending:
+                print("Already done!")
+                sys.exit()
+
+            replaced.append((N, str(t), t))
+            t.done = True
+            todo_file.replace_todo(t, t)
+            print("done: {}".format(str(t)))
 
-        t.done = True
-        print("done: {}".format(str(t)))
-    todo_file.save()
+        if opts.journal:
+            for N, old, t in replaced:
+                journal.replace("todo.txt", N, old, t)
+            journal.maybe_compact()
+        else:
+            todo_file.save()
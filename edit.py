@@ -2,15 +2,10 @@
 
 import argparse
 import os
-import readline
 import sys
 
-readline.parse_and_bind("TAB: complete")
-
-#libedit style
-#readline.parse_and_bind("bind -e")
-
 from todotxt import TODOFile, todo_from_line
+from todotxt import journal
 
 # NOTE -- copied and pasted from archive.py, should consolidate at some point
 
@@ -28,8 +23,10 @@ def completer(text, idx):
             return None
     return None
 
-def do_edit(todo, f):
-    "Edit the todo"
+def do_edit(handle, f):
+    "Edit the todo with the given handle in f"
+    import readline
+    todo = f.get_todo(handle)
     def hook():
         readline.insert_text(str(todo))
     readline.set_startup_hook(hook)
@@ -45,9 +42,12 @@ def do_edit(todo, f):
     readline.set_completer_delims(old_delims)
     if newval != str(todo):
         newtodo = todo_from_line(newval)
-        f.replace_todo(todo,
-                       newtodo)
-        f.save()
+        f.replace_todo(todo, newtodo)
+        # the file may have been written while we were editing, by hand
+        # or by the journal: keep those changes rather than save over them
+        with journal.locked(os.path.dirname(f.filename)):
+            f.merge_changes()
+            f.save()
         print("Saved :'{}'".format(str(newtodo)))
 
 
@@ -68,17 +68,24 @@ if __name__ == '__main__':
                         help="line number of todo to edit (starting at 1)")
     opts = parser.parse_args()
 
+    # only set up when actually editing, not for usage or --help
+    import readline
+    readline.parse_and_bind("TAB: complete")
+    #libedit style
+    #readline.parse_and_bind("bind -e")
+
+    # apply changes still waiting in the journal first
+    journal.compact(opts.dir)
     filename = os.path.join(opts.dir, opts.filename)
     
     f = TODOFile(filename)
-    todos = f.get_todos()
+    f.track_changes()
 
-    num = opts.N - 1
-    if num > len(todos):
-        print("Error: there are only {} todos in {}".format(len(todos),
-                                                            filename))
+    try:
+        f.get_todo(opts.N)
+    except KeyError:
+        print("Error: no todo on line {} of {}".format(opts.N, filename))
         print("they are: \n{}".format(list(map(str, f.get_todos()))))
         sys.exit(1)
-        
-    do_edit(todos[num], f)
 
+    do_edit(opts.N, f)
@@ -1,4 +1,5 @@
 from todotxt.project import ProjectFile
+from todotxt import journal
 
 import argparse
 import os
@@ -13,12 +14,17 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='todotxt review script')
     parser.add_argument('--dir', default=os.environ.get('TODO_DIR', '.'),
                         help="Directory to look for todo.txt files")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of processes to parse files with "
+                        "(0 for one per CPU)")
     parser.add_argument('-f', dest='filename', default='projects',
                         help="Path to projects file")
     opts = parser.parse_args()
+    # apply changes still waiting in the journal first
+    journal.compact(opts.dir)
 
     fn = os.path.join(opts.dir, opts.filename)
-    pf = ProjectFile(fn)
+    pf = ProjectFile(fn, jobs=opts.jobs or None)
     pf.save()
     print("saved project list that looked like this:")
     print(pf.padded_string(150, draw_dots=True))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from todotxt.journal import Journal
+from todotxt.prompt import prompt_lines
+
+if __name__ == '__main__':
+    # todo.sh usage:
+    if len(sys.argv) > 1 and sys.argv[1] == 'usage':
+        print("USAGE: prompt [@context]")
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='prints the (A) todos in '
+                                     'todo.txt like grep -n, for a prompt')
+    parser.add_argument('--dir', default=os.environ.get('TODO_DIR', '.'),
+                        help="Directory to look for todo.txt files")
+    parser.add_argument("context", nargs='?',
+                        help="only show todos in this @context")
+    opts = parser.parse_args()
+    # changes still waiting in the journal are shown as if applied,
+    # compacting here would hold up the prompt
+    pending = Journal(opts.dir).pending()
+
+    context = opts.context.lstrip("@") if opts.context else None
+    for n, line in prompt_lines(os.path.join(opts.dir, "todo.txt"), context,
+                                pending):
+        print("{}:{}".format(n, line))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from todotxt.client import request
+from todotxt import journal
+from todotxt.query import Query
+from todotxt.shards import done_path
+
+
+def print_matches(name, total, matches):
+    """prints matches, [(handle, todo or line), ...] from a file with
+    total todos, like todo.sh ls does"""
+    width = len(str(max([total] + [h for h, t in matches])))
+    for handle, t in sorted(matches, key=lambda m: str(m[1]).lower()):
+        print("{:0{}} {}".format(handle, width, t))
+    print("--")
+    print("{}: {} of {} tasks shown".format(name[:-4].upper(), len(matches),
+                                          total))
+
+
+if __name__ == '__main__':
+    # todo.sh usage:
+    if len(sys.argv) > 1 and sys.argv[1] == 'usage':
+        print("USAGE: query [-f file] [-p A] [--done|--undone] "
+              "[+project] [@context] [#hashtag]")
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='todotxt query script')
+    parser.add_argument('--dir', default=os.environ.get('TODO_DIR', '.'),
+                        help="Directory to look for todo.txt files")
+    parser.add_argument('-f', dest='fnpats', action='append',
+                        help="filename prefix to search, can be repeated. "
+                        "default is all files but done.txt")
+    parser.add_argument('-p', dest='priorities',
+                        help="priorities to show, e.g. 'A' or 'AB'")
+    parser.add_argument('--done', dest='done', action='store_true',
+                        default=None, help="only done todos")
+    parser.add_argument('--undone', dest='done', action='store_false',
+                        help="only todos that aren't done")
+    parser.add_argument('--created-after', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--created-before', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--done-after', help="YYYY-MM-DD, inclusive")
+    parser.add_argument('--done-before', help="YYYY-MM-DD, inclusive")
+    parser.add_argument("terms", nargs='*',
+                        help="+project, @context or #hashtag to match")
+    opts = parser.parse_args()
+
+    names = sorted(fn for fn in os.listdir(opts.dir)
+                   if fn.endswith(".txt") and not fn.startswith("."))
+    if "done.txt" not in names and os.path.isdir(done_path(opts.dir)):
+        # done todos split into shards are searched as done.txt
+        names = sorted(names + ["done.txt"])
+    if opts.fnpats:
+        files = [fn for fn in names
+                 if any(fn.startswith(p) for p in opts.fnpats)]
+    elif opts.done or opts.done_after or opts.done_before:
+        files = names
+    else:
+        files = [fn for fn in names if fn != "done.txt"]
+
+    tags = {'+': [], '@': [], '#': []}
+    for term in opts.terms:
+        if term[:1] not in tags:
+            print("'{}' is not a +project, @context or #hashtag".format(term))
+            sys.exit(1)
+        tags[term[0]].append(term[1:])
+
+    conditions = dict(priorities=opts.priorities, projects=tags['+'],
+                      contexts=tags['@'], hashtags=tags['#'],
+                      done=opts.done, files=files,
+                      created=(opts.created_after, opts.created_before),
+                      completed=(opts.done_after, opts.done_before))
+    reply = request(opts.dir, dict(op='query', **conditions))
+    if reply is not None:
+        if not reply['ok']:
+            print("Error: {}".format(reply['error']))
+            sys.exit(1)
+        for name, r in sorted(reply['results'].items()):
+            if len(r['matches']) > 0:
+                print_matches(name, r['total'], r['matches'])
+        sys.exit()
+
+    # no daemon running. imported here since it's slow to import and not
+    # needed when the daemon answers
+    from todotxt.store import TodoStore
+    # apply changes still waiting in the journal first
+    journal.compact(opts.dir)
+    store = TodoStore(opts.dir)
+    for name, matches in Query(**conditions).run(store).items():
+        if len(matches) > 0:
+            print_matches(name, store.total(name), matches)
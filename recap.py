@@ -8,6 +8,7 @@ import os
 import sys
 
 from todotxt import TODOFile, DATE_FMT
+from todotxt.shards import done_path
 
 def todos_grouped_by(alltodos, attr):
     d = defaultdict(list)
@@ -15,6 +16,47 @@ def todos_grouped_by(alltodos, attr):
         d[t.__getattribute__(attr)].append(t)
     return d
 
+def print_stats(columns, top=10):
+    per_day = columns.per_day()
+    if len(per_day) == 0:
+        print("No completed todos")
+        return
+    first, last = min(per_day), max(per_day)
+    span = (last - first).days + 1
+    busiest = max(per_day, key=per_day.get)
+    print("{} completed todos from {} to {}".format(len(columns), first,
+                                                   last))
+    print("  {:.1f} per day, {} on the busiest day ({})".format(
+        len(columns) / span, per_day[busiest], busiest))
+
+    lead = columns.lead_times()
+    if lead is not None:
+        n, mean, median, p90 = lead
+        print("  days from created to done (over {}): mean {:.1f}, "
+              "median {:.1f}, 90% within {:.1f}".format(n, mean, median, p90))
+    print()
+
+    per_hour = columns.per_hour()
+    most = max(per_hour)
+    if most > 0:
+        print("By hour")
+        print(80 * "-")
+        for hour, n in enumerate(per_hour):
+            print("  {:0>2}:00 {:>6} {}".format(hour, n,
+                                               "#" * round(60 * n / most)))
+        print()
+
+    for title, counts in (("By project", columns.per_project()),
+                          ("By context", columns.per_context())):
+        if len(counts) == 0:
+            continue
+        print(title)
+        print(80 * "-")
+        for name, n in sorted(counts.items(),
+                              key=lambda c: (-c[1], c[0]))[:top]:
+            print("  {:>6} {}".format(n, name))
+        print()
+
 if __name__ == '__main__':
     # todo.sh usage:
     if len(sys.argv) > 1 and sys.argv[1] == 'usage':
@@ -26,12 +68,24 @@ if __name__ == '__main__':
                         help="Directory to look for todo.txt files")
     parser.add_argument("--days", default=7, type=int,
                         help="Number of days in the past to recap")
+    parser.add_argument("--stats", action='store_true',
+                        help="Print completion statistics instead of the "
+                        "todos, over the same days (--days 0 for all)")
     opts = parser.parse_args()
 
-    done_file = TODOFile(os.path.join(opts.dir, "done.txt"))
+    done_filename = done_path(opts.dir)
+    if opts.days > 0:
+        done_todos = TODOFile.tail_done(done_filename, opts.days)
+    else:
+        done_todos = TODOFile.iter_todos(done_filename, attrgetter('done'))
+
+    if opts.stats:
+        # imported here, numpy is slow to import and only --stats needs it
+        from todotxt.analytics import DoneColumns
+        print_stats(DoneColumns.from_todos(done_todos))
+        sys.exit()
 
-    todos_by_done_date = todos_grouped_by(done_file.get_todos(),
-                                          'done_date')
+    todos_by_done_date = todos_grouped_by(done_todos, 'done_date')
 
     for date in sorted(todos_by_done_date.keys())[-opts.days:]:
         todos = todos_by_done_date[date]
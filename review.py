@@ -3,17 +3,13 @@
 import argparse
 import cmd
 from collections import OrderedDict
-from glob import glob
 import os
-import readline
 import sys
 
-readline.parse_and_bind("TAB: complete")
-
-#libedit style
-#readline.parse_and_bind("bind -e")
-
-from todotxt import TODO, TODOFile, todo_from_line
+from todotxt import TODO, todo_from_line
+from todotxt import journal
+from todotxt.store import TodoStore
+from todotxt.watch import watch
 
 IDXCHAR = "\N{ELECTRIC LIGHT BULB}  "
 
@@ -21,13 +17,13 @@ IDXCHAR = "\N{ELECTRIC LIGHT BULB}  "
 class ReviewShell(cmd.Cmd):
     prompt = "\N{HOT BEVERAGE}  "
 
-    def __init__(self, todo_dir, review_type='daily'):
+    def __init__(self, todo_dir, review_type='daily', jobs=1):
         super().__init__()
-        todo_files = glob(todo_dir + "/*.txt")
-        self.all_files = {}
-        for fn in todo_files:
-            f = TODOFile(fn)
-            self.all_files[os.path.basename(fn)] = f
+        # files are only read once they are looked at. changes made to
+        # them while reviewing, e.g. synced from a phone, are merged in
+        # before each command
+        self.all_files = TodoStore(todo_dir, track_changes=True)
+        self.watcher = watch(todo_dir)
         self.completed_files = []
 
         files = [('todo.txt',
@@ -43,8 +39,8 @@ class ReviewShell(cmd.Cmd):
                   IDXCHAR + "Review someday ideas. "
                   "Time to schedule something?")]
         self.to_review = OrderedDict(files)
-        for fn in self.to_review.keys():
-            if fn not in self.all_files.keys():
+        for fn in list(self.to_review.keys()):
+            if fn not in self.all_files:
                 del self.to_review[fn]
 
         if review_type == 'daily':
@@ -52,6 +48,9 @@ class ReviewShell(cmd.Cmd):
                 if fn in self.to_review:
                     del self.to_review[fn]
 
+        if jobs != 1:
+            self.all_files.preload(self.to_review.keys(), jobs)
+
         self.current_file_index = 0
         self.refresh_current_todos()
         self.current_todo_index = 0
@@ -106,6 +105,45 @@ class ReviewShell(cmd.Cmd):
     def refresh_current_todos(self):
         self.current_todos = sorted(self.current_file.get_todos())
 
+    def precmd(self, line):
+        self.merge_changes()
+        return line
+
+    def merge_changes(self, names=None):
+        """merges changes made on disk to the loaded files in names, by
+        default the ones the watcher saw change. the position in the
+        review stays on the current todo, or where it was if that was
+        removed."""
+        loaded = self.all_files.loaded()
+        if names is None:
+            names = self.watcher.changed()
+        for fn in sorted(names):
+            if fn not in loaded:
+                continue
+            merged = loaded[fn].merge_changes()
+            if merged is None:
+                continue
+            added, removed = merged
+            self.show_message("{} changed on disk: merged {} new and {} "
+                              "removed todos".format(fn, len(added),
+                                                     len(removed)))
+            if fn == self.current_filename:
+                self.keep_position()
+
+    def keep_position(self):
+        "refreshes current_todos, staying at the current todo if it's there"
+        try:
+            current = self.current_todo
+        except IndexError:
+            current = None
+        self.refresh_current_todos()
+        for i, t in enumerate(self.current_todos):
+            if t is current:
+                self.current_todo_index = i
+                return
+        self.current_todo_index = min(self.current_todo_index,
+                                      max(len(self.current_todos) - 1, 0))
+
     def goto_next_file(self):
         """returns False if no next file exists.
 
@@ -208,6 +246,7 @@ class ReviewShell(cmd.Cmd):
 
     def edit_todo_string(self, todo_string):
         "Edit a string representing a todo, return edited string"
+        import readline
         def hook():
             readline.insert_text(todo_string)
         readline.set_startup_hook(hook)
@@ -240,7 +279,8 @@ class ReviewShell(cmd.Cmd):
         n_next = self.show_upcoming(self.current_todo)
         if n_next == 0 and len(self.current_todo.projects) > 0:
             yn = input("No next actions for '{}'. "
-                       "Add a new one? [y]/n ".format(self.current_todo.projects))
+                       "Add a new one? [y]/n ".format(
+                           ", ".join(self.current_todo.projects)))
             if yn in ['Y', 'y', '']:
                 self.add_related_todo(self.current_todo, "")
 
@@ -289,7 +329,7 @@ class ReviewShell(cmd.Cmd):
         f = self.all_files[matching_filenames[0]]
         t = todo_from_line(todotxt)
         t.set_created_now()
-        f.add_todo(t)
+        f.append_todo(t)
         self.refresh_current_todos()
 
     def do_delete(self, rest):
@@ -304,8 +344,7 @@ class ReviewShell(cmd.Cmd):
     def move_to(self, todo, to_file):
         assert(self.current_file != to_file)
         print('moving to {}'.format(to_file.summary()))
-        to_file.add_todo(todo)
-        self.current_file.delete_todo(todo)
+        self.current_file.move_todo(todo, to_file)
         self.refresh_current_todos()
         # print('after move, cur_file has "{}" \n'
         #       'and to_file has "{}"'.format(self.current_file,
@@ -392,8 +431,12 @@ class ReviewShell(cmd.Cmd):
 
     def do_save(self, rest):
         "Write out all changes"
-        for f in self.all_files.values():
-            f.save()
+        # anything written since the last merge, e.g. by compacting the
+        # journal, is merged rather than saved over
+        with journal.locked(self.all_files.todo_dir):
+            self.merge_changes(self.all_files.loaded())
+            for f in self.all_files.loaded().values():
+                f.save()
         self.show_message("Saved.")
         self.dirty = False
 
@@ -421,6 +464,18 @@ if __name__ == '__main__':
     parser.add_argument('--type', default='daily',
                         choices=['daily', 'weekly'],
                         help="Type of review - controls which files are shown")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Number of processes to parse files with "
+                        "(0 for one per CPU)")
     opts = parser.parse_args()
 
-    ReviewShell(opts.dir, opts.type).cmdloop()
+    # only set up when actually editing, not for usage or --help
+    import readline
+    readline.parse_and_bind("TAB: complete")
+    #libedit style
+    #readline.parse_and_bind("bind -e")
+
+    # apply changes still waiting in the journal first
+    journal.compact(opts.dir)
+
+    ReviewShell(opts.dir, opts.type, opts.jobs or None).cmdloop()
@@ -1,18 +1,123 @@
 # todo.txt parsing / management library
 
-from collections import defaultdict
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 from datetime import datetime
 from functools import total_ordering
+import gc
+import mmap
 import os
 import re
-import tempfile
+import sys
+import time
+
+from todotxt import cache
+from todotxt import prompt
 
 DATE_FMT = "%Y-%m-%d"
 TIME_FMT = "%X"
+# marks a cached datetime that hasn't been parsed yet
+_UNPARSED = object()
+# the TODO attributes TODOFile keeps sorted date indexes for
+DATE_ATTRS = ('created_date', 'done_date')
+
+
+def _intern_tags(tags):
+    "returns tags as a tuple of interned strings, shared () if empty"
+    if not tags:
+        return ()
+    return tuple(map(sys.intern, tags))
+
+
+def _intern_date(date):
+    return sys.intern(date) if date else date
+
+
+_iso_date_re = re.compile(r"\d{4}-\d\d-\d\d")
+_time_re = re.compile(r"\d\d:\d\d:\d\d")
+
+
+def _parse_datetime(date_val, time_val=None):
+    """like strptime with DATE_FMT and TIME_FMT, but builds the datetime
+    directly for the usual YYYY-MM-DD and HH:MM:SS (%X in the C locale)
+    shapes."""
+    if (_iso_date_re.fullmatch(date_val) and
+            (time_val is None or _time_re.fullmatch(time_val))):
+        try:
+            if time_val is None:
+                return datetime(int(date_val[:4]), int(date_val[5:7]),
+                                int(date_val[8:]))
+            return datetime(int(date_val[:4]), int(date_val[5:7]),
+                            int(date_val[8:]), int(time_val[:2]),
+                            int(time_val[3:5]), int(time_val[6:]))
+        except ValueError:
+            pass
+    if time_val is None:
+        return datetime.strptime(date_val, DATE_FMT)
+    return datetime.strptime("{} {}".format(date_val, time_val),
+                             "{} {}".format(DATE_FMT, TIME_FMT))
+
+
+def _cached_field(name, convert=None, tags=False, lazy=False):
+    """a property for a TODO field that drops the cached strings when it
+    is set. convert, if given, is applied to new values. tags fields
+    keep the tags from before the first change, see TODO._filed_under.
+    lazy fields are parsed on first use, see TODO._rest."""
+    attr = '_' + name
+
+    if lazy:
+        def getter(self):
+            if self._rest is not None:
+                self._parse_rest()
+            return getattr(self, attr)
+    else:
+        def getter(self):
+            return getattr(self, attr)
+
+    def setter(self, value):
+        if convert is not None:
+            value = convert(value)
+        if lazy and self._rest is not None:
+            self._parse_rest()
+        if tags and self._filed_under is None:
+            self._filed_under = (self._projects, self._contexts,
+                                 self._hashtags)
+        setattr(self, attr, value)
+        self._invalidate()
+    return property(getter, setter)
 
 
 @total_ordering
 class TODO:
+    """A single todo.
+
+    Uses __slots__ and interned tag tuples, since done.txt can hold a
+    very large number of these.
+
+    _filed_under is None, or the (projects, contexts, hashtags) the todo
+    had before its tags were changed: TODOFile's indexes still file it
+    under those until it indexes it again.
+
+    Parsed todos only split off the done date, priority and created date
+    at first. The rest of the line is kept in _rest until the text or
+    tags are first used, so reading a big done.txt for its dates doesn't
+    build the tag tuples of every line.
+    """
+    __slots__ = ('_text', '_priority', '_created_date', '_done_date',
+                 '_contexts', '_projects', '_hashtags',
+                 '_str', '_sort_key', '_rev', '_done_dt', '_created_dt',
+                 '_filed_under', '_rest')
+
+    text = _cached_field('text', lazy=True)
+    priority = _cached_field('priority')
+    created_date = _cached_field('created_date', _intern_date)
+    done_date = _cached_field('done_date', _intern_date)
+    contexts = _cached_field('contexts', _intern_tags, tags=True, lazy=True)
+    projects = _cached_field('projects', _intern_tags, tags=True, lazy=True)
+    hashtags = _cached_field('hashtags', _intern_tags, tags=True, lazy=True)
+
     def __init__(self, text, priority=None, created_date=None,
                  done_date=None, contexts=None, projects=None,
                  hashtags=None, done=False):
@@ -21,52 +126,48 @@ class TODO:
 
         _date args are strings
 
-        contexts, projects and hashtags are lists
+        contexts, projects and hashtags are sequences, stored as tuples.
         """
-        self.text = text
-        self.priority = priority
-        self.created_date = created_date
-        self.done_date = done_date
-        self.contexts = contexts if contexts else []
-        self.projects = projects if projects else []
-        self.hashtags = hashtags if hashtags else []
+        self._text = text
+        self._priority = priority
+        self._created_date = _intern_date(created_date)
+        self._done_date = _intern_date(done_date)
+        self._contexts = _intern_tags(contexts)
+        self._projects = _intern_tags(projects)
+        self._hashtags = _intern_tags(hashtags)
+        self._rev = 0
+        self._filed_under = None
+        self._rest = None
+        self._invalidate()
+
+    def _parse_rest(self):
+        "splits _rest into the text and tags"
+        (self._text, self._contexts, self._projects,
+         self._hashtags) = _split_words(self._rest.split())
+        self._rest = None
+
+    def _invalidate(self):
+        """forget the cached string and sort key. bumps _rev, which
+        TODOFile uses to notice changed todos."""
+        self._str = None
+        self._sort_key = None
+        self._done_dt = _UNPARSED
+        self._created_dt = _UNPARSED
+        self._rev += 1
 
     def set_created_now(self):
         "sets created date to now."
         self._set_datetime_attr_now('created')
 
     def _get_str_components(self):
-        d = {}
-        d['donestr'] = "x {} ".format(self.done_date) if self.done_date else ""
-
-        if not self.done_date:
-            d['pstr'] = "({}) ".format(self.priority) if self.priority else ""
-        else:
-            d['pstr'] = ""
-        d['cdstr'] = (self.created_date + " ") if self.created_date else ""
-
-        d['text'] = self.text
-        if len(self.contexts) + len(self.projects) + len(self.hashtags) > 0:
-            d['text'] += " "
-
-        d['cxstr'] = " ".join(["@{}".format(c)
-                               for c in sorted(self.contexts)])
-        if len(self.contexts) > 0:
-            d['cxstr'] += " "
-        d['prjstr'] = " ".join(["+{}".format(p)
-                                for p in sorted(self.projects)])
-        if len(self.projects) > 0:
-            d['prjstr'] += " "
-
-        d['htstr'] = " ".join(["#{}".format(p)
-                                for p in sorted(self.hashtags)])
-        if len(self.hashtags) > 0:
-            d['htstr'] += " "
-
-        return d
+        k = self.sort_key()
+        return {'donestr': k[0], 'htstr': k[1], 'prjstr': k[2],
+                'cxstr': k[3], 'cdstr': k[4], 'pstr': k[5], 'text': k[6]}
 
     def __str__(self):
-        return self.get_string()
+        if self._str is None:
+            self._str = self.get_string()
+        return self._str
 
     def get_string(self, show_done=True, show_tags=True):
         d = self._get_str_components()
@@ -88,18 +189,15 @@ class TODO:
 
     @property
     def projects_string(self):
-        d = self._get_str_components()
-        return d['prjstr']
+        return self.sort_key()[2]
 
     @property
     def contexts_string(self):
-        d = self._get_str_components()
-        return d['cxstr']
+        return self.sort_key()[3]
 
     @property
     def hashtags_string(self):
-        d = self._get_str_components()
-        return d['htstr']
+        return self.sort_key()[1]
 
     def __eq__(self, other):
         # depends on sorted context/project arrays
@@ -123,128 +221,642 @@ class TODO:
         setattr(self, attr + '_date',
                 datetime.strftime(now, DATE_FMT))
         timestr = datetime.strftime(now, TIME_FMT)
-        self.hashtags.append("{}-{}".format(attr, timestr))
+        self.hashtags = self.hashtags + ("{}-{}".format(attr, timestr),)
 
     @property
     def done_datetime(self):
-        "returns a datetime instance if the 'done-<TIME>' hashtag exists"
-        return self._datetime_attr('done')
+        """returns a datetime instance for done_date, with the time from
+        the 'done-<TIME>' hashtag if it exists. None if not done."""
+        if self._done_dt is _UNPARSED:
+            self._done_dt = self._datetime_attr('done')
+        return self._done_dt
 
     @property
     def created_datetime(self):
-        return self._datetime_attr('created')
+        "like done_datetime, for created_date and 'created-<TIME>'"
+        if self._created_dt is _UNPARSED:
+            self._created_dt = self._datetime_attr('created')
+        return self._created_dt
 
     def _datetime_attr(self, attrname):
-        """returns a datetime from self.attrname and a hashtag called
-        'attrname-<date>'
+        """returns a datetime from self.attrname_date and a hashtag called
+        'attrname-<time>'
 
         used for attrs 'done' and 'created'
         """
-        if not getattr(self, attrname):
+        date_val = getattr(self, attrname + "_date")
+        if not date_val:
             return None
+        prefix = attrname + "-"
         for ht in self.hashtags:
-            if ht.startswith(attrname + "-"):
-                date_val = getattr(self, attrname + "_date")
-                return datetime.strptime("{} {}".format(date_val,
-                                                        ht[5:]),
-                                         "{} {}".format(DATE_FMT, TIME_FMT))
+            if ht.startswith(prefix):
+                return _parse_datetime(date_val, ht[len(prefix):])
+
+        return _parse_datetime(date_val)
 
-        return datetime.strptime(self.done_date, DATE_FMT)
+    def sort_key(self):
+        "returns the (cached) tuple of string components todos sort by"
+        if self._sort_key is not None:
+            return self._sort_key
+        donestr = "x {} ".format(self.done_date) if self.done_date else ""
+
+        if not self.done_date:
+            pstr = "({}) ".format(self.priority) if self.priority else ""
+        else:
+            pstr = ""
+        cdstr = (self.created_date + " ") if self.created_date else ""
+
+        text = self.text
+        if len(self.contexts) + len(self.projects) + len(self.hashtags) > 0:
+            text += " "
+
+        cxstr = " ".join(["@{}".format(c)
+                          for c in sorted(self.contexts)])
+        if len(self.contexts) > 0:
+            cxstr += " "
+        prjstr = " ".join(["+{}".format(p)
+                           for p in sorted(self.projects)])
+        if len(self.projects) > 0:
+            prjstr += " "
+
+        htstr = " ".join(["#{}".format(p)
+                          for p in sorted(self.hashtags)])
+        if len(self.hashtags) > 0:
+            htstr += " "
+
+        self._sort_key = (donestr, htstr, prjstr, cxstr, cdstr, pstr, text)
+        return self._sort_key
 
     def __lt__(self, other):
-        def get_tuple(d):
-            return (d['donestr'],
-                    d['htstr'],
-                    d['prjstr'],
-                    d['cxstr'],
-                    d['cdstr'],
-                    d['pstr'],
-                    d['text'])
-        d_self = self._get_str_components()
-        d_other = other._get_str_components()
-        return get_tuple(d_self) < get_tuple(d_other)
+        return self.sort_key() < other.sort_key()
 
 
-def todo_from_line(line):
-    """returns a TODO object parsed from 'line'"""
-    prio_re = re.compile(r"\(([A-Z])\)")
+_prio_re = re.compile(r"\(([A-Z])\)")
+# the shape strptime(DATE_FMT) accepts. matching words are still checked
+# with strptime, since that also rejects e.g. 2015-02-30.
+_date_shape_re = re.compile(r"\d{4}-\d{1,2}-\d{1,2}")
+_checked_dates = {}
+_new_todo = object.__new__
+
+
+def _is_date(word):
+    "returns True if word parses as a DATE_FMT date"
+    ok = _checked_dates.get(word)
+    if ok is None:
+        if not _date_shape_re.fullmatch(word):
+            return False
+        try:
+            datetime.strptime(word, DATE_FMT)
+            ok = True
+        except ValueError:
+            ok = False
+        if len(_checked_dates) > 100000:
+            _checked_dates.clear()
+        _checked_dates[word] = ok
+    return ok
+
 
-    words = line.split()
+def _parse_line(line):
+    # the done date, priority and created date are the first four words
+    # at most, the rest is split later, see TODO._rest
+    words = line.split(None, 4)
     if len(words) == 0:
         return None
 
-    t_done = False
+    i = 0
     t_done_date = None
     if words[0][0] == 'x':
-        t_done = True
-        t_done_date = words[1]
-        words = words[2:]
+        t_done_date = sys.intern(words[1])
+        i = 2
 
     # TODO: ignore priority for done tasks, use k:v?
     t_prio = None
-    prio_match = prio_re.match(words[0])
+    prio_match = _prio_re.match(words[i])
     if prio_match:
-        t_prio = prio_match.groups()[0]
-        words = words[1:]
+        t_prio = prio_match.group(1)
+        i += 1
 
     t_created_date = None
-    try:
-        d = datetime.strptime(words[0], DATE_FMT)
-        d  # flakes :(
-        t_created_date = words[0]
-        words = words[1:]
-    except ValueError:
-        pass
+    if i < len(words) and _is_date(words[i]):
+        t_created_date = sys.intern(words[i])
+        i += 1
+
+    if i == len(words):
+        return _make_todo("", t_prio, t_created_date, t_done_date,
+                          (), (), ())
+    return _make_todo(None, t_prio, t_created_date, t_done_date,
+                      None, None, None, " ".join(words[i:]))
+
 
+def _split_words(words):
+    "returns (text, contexts, projects, hashtags) from a todo's words"
+    intern = sys.intern
     t_projects = []
     t_contexts = []
     t_hashtags = []
     t_txt = []
     for word in words:
-        if word.startswith("+"):
-            t_projects.append(word[1:])
-        elif word.startswith("@"):
-            t_contexts.append(word[1:])
-        elif word.startswith("#"):
-            t_hashtags.append(word[1:])
+        c = word[0]
+        if c == "+":
+            t_projects.append(intern(word[1:]))
+        elif c == "@":
+            t_contexts.append(intern(word[1:]))
+        elif c == "#":
+            t_hashtags.append(intern(word[1:]))
         else:
             t_txt.append(word)
-    t_txt = " ".join(t_txt)
+    return (" ".join(t_txt),
+            tuple(t_contexts) if t_contexts else (),
+            tuple(t_projects) if t_projects else (),
+            tuple(t_hashtags) if t_hashtags else ())
+
+
+def _make_todo(text, priority, created_date, done_date,
+               contexts, projects, hashtags, rest=None):
+    """builds a TODO from fields that are already interned and tuples,
+    skipping TODO.__init__. if rest is given, the text and tags are None
+    and parsed from it when first used."""
+    t = _new_todo(TODO)
+    t._text = text
+    t._priority = priority
+    t._created_date = created_date
+    t._done_date = done_date
+    t._contexts = contexts
+    t._projects = projects
+    t._hashtags = hashtags
+    t._str = None
+    t._sort_key = None
+    t._rev = 0
+    t._done_dt = _UNPARSED
+    t._created_dt = _UNPARSED
+    t._filed_under = None
+    t._rest = rest
+    return t
+
+
+def _todo_fields(t):
+    "the arguments to _make_todo that rebuild t"
+    return (t._text, t._priority, t._created_date, t._done_date,
+            t._contexts, t._projects, t._hashtags, t._rest)
+
+
+def parse_lines(lines):
+    """returns an iterator of TODO objects parsed from the strings in
+    'lines', with None for blank lines, like todo_from_line."""
+    return map(_parse_line, lines)
+
+
+def todo_from_line(line):
+    """returns a TODO object parsed from 'line'"""
+    return _parse_line(line)
+
+
+@contextmanager
+def gc_paused():
+    """pauses the cyclic garbage collector. loading creates lots of
+    objects and no garbage, so don't let the gc walk them over and
+    over."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def iter_lines_reversed(filename):
+    """yields the lines of filename from last to first, reading backwards
+    from the end through mmap instead of loading the whole file."""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            end = len(m)
+            while end > 0:
+                start = m.rfind(b"\n", 0, end - 1) + 1
+                yield m[start:end].decode()
+                end = start
+
+
+def _order_path(filename):
+    """returns where done_in_order saves what it found out about
+    filename: next to it as .<name>.order, or in the cache dir if caching
+    is on (see todotxt.cache)."""
+    cache_dir = cache.cache_dir()
+    if cache_dir:
+        return cache.cache_path(cache_dir, filename, 'order')
+    head, tail = os.path.split(filename)
+    return os.path.join(head, ".{}.order".format(tail))
+
 
-    return TODO(t_txt, priority=t_prio,
-                created_date=t_created_date,
-                done_date=t_done_date,
-                contexts=t_contexts,
-                projects=t_projects,
-                hashtags=t_hashtags,
-                done=t_done)
+def done_in_order(filename):
+    """True if the done todos in filename are in done date order, the
+    order archive_done appends them in.
+
+    Finding out takes a pass over the whole file, though a much quicker
+    one than parsing it, so the answer is saved with the file's
+    fingerprint and only looked for again once the file changes. Like
+    the cache, an answer saved within cache.RACY_NS of the file's mtime
+    isn't trusted, or saved.
+    """
+    import json
+    fp = cache.fingerprint(filename)
+    path = _order_path(filename)
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        if saved['fingerprint'] == list(fp) and \
+                saved['stored'] - fp[2] >= cache.RACY_NS:
+            return saved['in_order']
+    except (OSError, ValueError, TypeError, KeyError):
+        pass
+    last = b""
+    in_order = True
+    with open(filename, 'rb') as f:
+        for line in f:
+            # done lines as _parse_line sees them, without parsing
+            if line.lstrip()[:1] != b"x":
+                continue
+            words = line.split(None, 2)
+            if len(words) < 2:
+                continue
+            if words[1] < last:
+                in_order = False
+                break
+            last = words[1]
+    stored = time.time_ns()
+    if stored - fp[2] >= cache.RACY_NS:
+        import tempfile
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    'w', dir=os.path.dirname(path) or ".",
+                    delete=False) as fout:
+                json.dump({'fingerprint': list(fp), 'stored': stored,
+                           'in_order': in_order}, fout)
+            os.replace(fout.name, path)
+        except OSError:
+            pass
+    return in_order
 
 
 class TODOFile:
-    def __init__(self, filename):
+    """A todo.txt file loaded into memory.
+
+    Each todo gets a handle when it is added: its line number (starting
+    at 1) for todos loaded from the file, the next free number for todos
+    added later. Handles stay the same for the life of the object, so
+    they can be used to address todos after others are added or deleted.
+    """
+    def __init__(self, filename, cache_dir=None):
+        """loads filename. parsed todos are cached in cache_dir, or in
+        $TODOTXT_CACHE_DIR if cache_dir is None, see todotxt.cache."""
+        self._setup(filename, cache_dir)
+        with gc_paused():
+            if not (self.cache_dir and self._load_cache()):
+                self._parse()
+                self._recalc()
+                self._after_sync()
+
+    def _setup(self, filename, cache_dir):
         self.filename = filename
-        self._todos = []
-        with open(self.filename, 'r') as f:
-            self._todos += [todo_from_line(l) for l in f.readlines()]
-        self._todos = [t for t in self._todos if t is not None]
+        self.cache_dir = cache_dir if cache_dir else cache.cache_dir()
+        self._todos = {}
+        # id(todo) -> handle, built by handle_of when first needed
+        self._handles = None
+        self._forget_lines()
+        # set when the file was merged with changes made on disk, so
+        # _offsets doesn't describe it and the next save rewrites it
+        self._layout_stale = False
+        # Counter of the lines on disk, if tracking changes
+        self._base = None
+
+    def _forget_lines(self):
+        """forgets where the todos are on disk. that is kept by handle, in
+        arrays since done.txt can be big: _offsets and _lengths of each
+        todo's line as last written, in bytes and without the newline,
+        and the todo's _rev then in _revs. the offset is -1 for handles
+        that aren't on disk, the rev -1 for todos replaced since."""
+        self._offsets = array('q')
+        self._lengths = array('q')
+        self._revs = array('q')
+
+    def _reserve_lines(self, next_handle):
+        "makes room in the line arrays for handles below next_handle"
+        grow = next_handle - len(self._offsets)
+        if grow > 0:
+            pad = array('q', [-1]) * grow
+            self._offsets += pad
+            self._lengths += pad
+            self._revs += pad
+
+    def _on_disk(self, handle):
+        "True if handle has a line on disk"
+        return handle < len(self._offsets) and self._offsets[handle] >= 0
+
+    def _lines_on_disk(self):
+        "returns the handles that have a line on disk"
+        return [h for h, offset in enumerate(self._offsets) if offset >= 0]
+
+    def _wrote(self, handle, todo, offset, length):
+        "records that todo, at handle, was written at offset"
+        self._reserve_lines(handle + 1)
+        self._offsets[handle] = offset
+        self._lengths[handle] = length
+        self._revs[handle] = todo._rev
 
+    @classmethod
+    def from_cache(cls, filename, cache_dir=None):
+        """returns the TODOFile for filename if it can be loaded from the
+        cache, None otherwise."""
+        self = cls.__new__(cls)
+        self._setup(filename, cache_dir)
+        with gc_paused():
+            if self.cache_dir and self._load_cache():
+                return self
+        return None
+
+    @classmethod
+    def from_records(cls, filename, fingerprint, next_handle, records,
+                     cache_dir=None):
+        """returns a TODOFile for filename from lines parsed elsewhere.
+
+        fingerprint is todotxt.cache's fingerprint of the file that was
+        parsed, records are (handle, offset, length, todo) for each
+        todo, like _parse finds them.
+        """
+        self = cls.__new__(cls)
+        self._setup(filename, cache_dir)
+        with gc_paused():
+            self._reserve_lines(next_handle)
+            for h, offset, length, t in records:
+                self._todos[h] = t
+                self._wrote(h, t, offset, length)
+            self._next_handle = next_handle
+            self._fingerprint = fingerprint
+            self._recalc()
+            self._after_sync()
+        return self
+
+    def _parse(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+            self._fingerprint = cache.stat_fingerprint(os.fstat(f.fileno()))
+        raws = data.splitlines(True)
+        self._reserve_lines(len(raws) + 1)
+        todos = self._todos
+        offsets = self._offsets
+        lengths = self._lengths
+        revs = self._revs
+        offset = 0
+        for n, raw in enumerate(raws, 1):
+            line = raw.decode()
+            t = _parse_line(line)
+            if t is not None:
+                todos[n] = t
+                offsets[n] = offset
+                lengths[n] = len(raw.rstrip(b"\r\n"))
+                revs[n] = 0
+            offset += len(raw)
+        self._next_handle = len(raws) + 1
+
+    def _cache_path(self):
+        return cache.cache_path(self.cache_dir, self.filename, 'todos')
+
+    def _load_cache(self):
+        "loads from the cache if it is current. returns True on success"
+        fp = cache.fingerprint(self.filename)
+        data = cache.load(self._cache_path(), fp)
+        if data is None:
+            return False
+        self._next_handle, records = data
+        self._reserve_lines(self._next_handle)
+        todos = self._todos
+        offsets = self._offsets
+        lengths = self._lengths
+        revs = self._revs
+        for h, offset, length, fields in records:
+            todos[h] = _make_todo(*fields)
+            offsets[h] = offset
+            lengths[h] = length
+            revs[h] = 0
+        self._fingerprint = fp
         self._recalc()
+        return True
+
+    def _after_sync(self):
+        "updates what's kept along with the file after reading or writing it"
+        self._store_cache()
+        prompt.update(self)
+        if self._base is not None:
+            self._base = Counter(map(str, self._todos.values()))
+
+    def _store_cache(self):
+        """writes what is on disk to the cache, if caching is on and all
+        todos are saved."""
+        if not self.cache_dir or \
+                len(self._lines_on_disk()) != len(self._todos):
+            return
+        records = []
+        for h, t in self._todos.items():
+            if not self._on_disk(h) or self._revs[h] != t._rev:
+                return
+            records.append((h, self._offsets[h], self._lengths[h],
+                            _todo_fields(t)))
+        records.sort(key=lambda r: r[1])
+        cache.store(self._cache_path(), self._fingerprint,
+                    (self._next_handle, records))
+
+    @staticmethod
+    def iter_todos(filename, predicate=None):
+        """yields the todos in filename one at a time without loading the
+        whole file. skips blank lines, and todos for which predicate
+        returns False if a predicate is given. filename may also be a
+        directory of done shards, see todotxt.shards."""
+        if os.path.isdir(filename):
+            from todotxt.shards import DoneArchive
+            yield from DoneArchive(filename).iter_todos(predicate)
+            return
+        with open(filename, 'r') as f:
+            for t in parse_lines(f):
+                if t is None:
+                    continue
+                if predicate is None or predicate(t):
+                    yield t
+
+    @staticmethod
+    def tail_done(filename, ndays):
+        """returns the done todos from the last ndays distinct done dates
+        in filename, in file order.
+
+        If the done todos are in done date order (see done_in_order),
+        which done.txt written by archive_done is, reads backwards from
+        the end of the file and stops at the first todo done before all
+        of those dates. Otherwise the whole file has to be read. filename
+        may also be a directory of done shards.
+        """
+        if os.path.isdir(filename):
+            from todotxt.shards import DoneArchive
+            return DoneArchive(filename).tail_done(ndays)
+        if not done_in_order(filename):
+            todos = list(TODOFile.iter_todos(filename, lambda t: t.done))
+            dates = sorted(set(t.done_date for t in todos))[-ndays:]
+            if not dates:
+                return todos
+            return [t for t in todos if t.done_date >= dates[0]]
+        dates = set()
+        cutoff = None
+        todos = []
+        for line in iter_lines_reversed(filename):
+            t = todo_from_line(line)
+            if t is None or not t.done:
+                continue
+            if t.done_date not in dates:
+                if cutoff is not None and t.done_date < cutoff:
+                    break
+                dates.add(t.done_date)
+                if len(dates) >= ndays:
+                    cutoff = sorted(dates)[-ndays]
+            todos.append(t)
+        todos.reverse()
+        if cutoff is None:
+            return todos
+        return [t for t in todos if t.done_date >= cutoff]
 
     def __str__(self):
-        return "\n".join(map(str, self._todos))
+        return "\n".join(map(str, self._todos.values()))
 
     def _recalc(self):
-        self.projects = defaultdict(list)
-        self.contexts = defaultdict(list)
-        self.hashtags = defaultdict(list)
-
-        for t in self._todos:
-            for p in t.projects:
-                self.projects[p].append(t)
-            for c in t.contexts:
-                self.contexts[c].append(t)
-            for ht in t.hashtags:
-                self.hashtags[ht].append(t)
+        # built on first use, see _indexes and todos_by_date
+        self._tag_indexes = None
+        self._date_indexes = None
+
+    @property
+    def projects(self):
+        "{project: [todos with it]}, built the first time it's needed"
+        return self._indexes()[0]
+
+    @property
+    def contexts(self):
+        "{context: [todos with it]}, built the first time it's needed"
+        return self._indexes()[1]
+
+    @property
+    def hashtags(self):
+        "{hashtag: [todos with it]}, built the first time it's needed"
+        return self._indexes()[2]
+
+    def _indexes(self):
+        """returns the project, context and hashtag indexes. many runs
+        never look at them, so they're built on first use and kept up to
+        date after that."""
+        if self._tag_indexes is None:
+            self._tag_indexes = (defaultdict(list), defaultdict(list),
+                                 defaultdict(list))
+            with gc_paused():
+                for t in self._todos.values():
+                    self._file_todo(t)
+        return self._tag_indexes
+
+    def _file_todo(self, todo):
+        """adds todo to the tag indexes. if its tags are changed in place
+        later, the todo keeps the ones it was filed under, so it can
+        still be removed again."""
+        todo._filed_under = None
+        keys = (todo.projects, todo.contexts, todo.hashtags)
+        for index, names in zip(self._tag_indexes, keys):
+            for name in names:
+                index[name].append(todo)
+
+    def _index_todo(self, handle, todo):
+        "adds todo to the indexes that have been built"
+        if self._tag_indexes is not None:
+            self._file_todo(todo)
+        if self._date_indexes is not None:
+            self._index_dates(handle, todo)
+
+    def _unindex_todo(self, handle, todo):
+        "removes todo from the indexes, using the keys it was filed under"
+        if self._date_indexes is not None:
+            self._unindex_dates(handle)
+        if self._tag_indexes is None:
+            return
+        keys = todo._filed_under or (todo.projects, todo.contexts,
+                                     todo.hashtags)
+        for index, names in zip(self._tag_indexes, keys):
+            for name in names:
+                bucket = index.get(name)
+                if bucket is None:
+                    continue
+                for i in range(len(bucket) - 1, -1, -1):
+                    if bucket[i] is todo:
+                        del bucket[i]
+                        break
+                if len(bucket) == 0:
+                    del index[name]
+
+    def _index_dates(self, handle, todo):
+        dates = (todo.created_date, todo.done_date)
+        self._dated[handle] = dates
+        for index, date in zip(self._date_indexes, dates):
+            if date:
+                insort(index, (date, handle))
+
+    def _unindex_dates(self, handle):
+        dates = self._dated.pop(handle, None)
+        if dates is None:
+            return
+        for index, date in zip(self._date_indexes, dates):
+            if date:
+                i = bisect_left(index, (date, handle))
+                del index[i]
+
+    def _date_bounds(self, attr, first, last):
+        """returns (date index, lo, hi) such that index[lo:hi] are the
+        (date, handle) pairs with first <= date <= last"""
+        if self._date_indexes is None:
+            self._dated = {h: (t.created_date, t.done_date)
+                           for h, t in self._todos.items()}
+            self._date_indexes = tuple(
+                sorted((dates[i], h) for h, dates in self._dated.items()
+                       if dates[i])
+                for i in range(len(DATE_ATTRS)))
+        index = self._date_indexes[DATE_ATTRS.index(attr)]
+        lo = 0 if first is None else bisect_left(index, (first, 0))
+        hi = (len(index) if last is None
+              else bisect_right(index, (last, float('inf'))))
+        return index, lo, hi
+
+    @property
+    def date_indexed(self):
+        "True once the sorted date indexes have been built"
+        return self._date_indexes is not None
+
+    def count_by_date(self, attr, first=None, last=None):
+        """returns how many todos have first <= attr <= last, where attr
+        is 'created_date' or 'done_date'. either end may be None."""
+        index, lo, hi = self._date_bounds(attr, first, last)
+        return max(0, hi - lo)
+
+    def todos_by_date(self, attr, first=None, last=None):
+        """returns the todos with first <= attr <= last, where attr is
+        'created_date' or 'done_date', ordered by that date.
+
+        Uses a sorted index of the dates that is built the first time it
+        is needed and kept up to date after that, so lookups only touch
+        the matching todos.
+        """
+        index, lo, hi = self._date_bounds(attr, first, last)
+        return [self._todos[h] for d, h in index[lo:hi]]
+
+    def done_between(self, first=None, last=None):
+        "returns the todos done between the dates first and last"
+        return self.todos_by_date('done_date', first, last)
+
+    def created_between(self, first=None, last=None):
+        "returns the todos created between the dates first and last"
+        return self.todos_by_date('created_date', first, last)
 
     def summary(self):
         return ("{}: {} todos, {} projects,  "
@@ -256,24 +868,277 @@ class TODOFile:
                                      len(self.hashtags)))
 
     def add_todo(self, todo):
-        self._todos.append(todo)
-        self._recalc()
+        "adds todo at the end of the file, returns its handle"
+        handle = self._next_handle
+        self._next_handle += 1
+        self._todos[handle] = todo
+        if self._handles is not None:
+            self._handles[id(todo)] = handle
+        self._index_todo(handle, todo)
+        return handle
+
+    def append_todo(self, todo):
+        """adds todo like add_todo, and also appends it to the file on
+        disk right away. returns its handle."""
+        return self.append_todos([todo])[0]
+
+    def append_todos(self, todos):
+        """adds todos like add_todo, and also appends them to the file on
+        disk right away, with a single write. returns their handles."""
+        if len(todos) == 0:
+            return []
+        unchanged = self._on_disk_unchanged()
+        lines = [str(t).encode() for t in todos]
+        with open(self.filename, 'ab+') as f:
+            offset, st = _append(f, b"\n".join(lines) + b"\n")
+        handles = [self.add_todo(t) for t in todos]
+        if unchanged:
+            # the file is still what we know plus these lines, even if
+            # the next save rewrites it after a merge
+            before = self._fingerprint
+            self._fingerprint = cache.stat_fingerprint(st)
+            prompt.appended(self.filename, before, self._fingerprint, todos)
+            if self._base is not None:
+                self._base.update(map(str, todos))
+        if unchanged and not self._layout_stale:
+            for h, t, data in zip(handles, todos, lines):
+                self._wrote(h, t, offset, len(data))
+                offset += len(data) + 1
+            # todos added but not saved yet go after these on disk
+            for h in [h for h in self._todos if not self._on_disk(h)]:
+                self._todos[h] = self._todos.pop(h)
+        return handles
+
+    def remove_done(self):
+        """removes all done todos in one pass over the file, returns them
+        in file order."""
+        done = [(h, t) for h, t in self._todos.items() if t.done]
+        for h, t in done:
+            del self._todos[h]
+            if self._handles is not None:
+                del self._handles[id(t)]
+        if len(done) > 0:
+            # cheaper than unindexing them one by one
+            self._recalc()
+        return [t for h, t in done]
 
     def delete_todo(self, todo):
-        self._todos.remove(todo)
-        self._recalc()
+        self.delete_handle(self.handle_of(todo))
+
+    def delete_handle(self, handle):
+        todo = self._todos.pop(handle)
+        if self._handles is not None:
+            del self._handles[id(todo)]
+        self._unindex_todo(handle, todo)
 
     def replace_todo(self, old, new):
-        self._todos[self._todos.index(old)] = new
-        self._recalc()
+        "puts new in old's place. new keeps old's handle."
+        handle = self.handle_of(old)
+        old = self._todos[handle]
+        self._unindex_todo(handle, old)
+        handles = self._handle_map()
+        del handles[id(old)]
+        self._todos[handle] = new
+        handles[id(new)] = handle
+        if self._on_disk(handle):
+            self._revs[handle] = -1
+        self._index_todo(handle, new)
+
+    def move_todo(self, todo, to_file):
+        "moves todo to the end of to_file, returns its handle there"
+        self.delete_todo(todo)
+        return to_file.add_todo(todo)
+
+    def _handle_map(self):
+        "returns {id(todo): handle}, built the first time it's needed"
+        if self._handles is None:
+            self._handles = {id(t): h for h, t in self._todos.items()}
+        return self._handles
+
+    def handle_of(self, todo):
+        "returns the handle of todo, raises ValueError if not in this file"
+        handle = self._handle_map().get(id(todo))
+        if handle is not None:
+            return handle
+        # not one of ours, fall back to an equal one
+        for h, t in self._todos.items():
+            if t == todo:
+                return h
+        raise ValueError("{} not in {}".format(todo, self.filename))
+
+    def get_todo(self, handle):
+        "returns the todo for handle, raises KeyError if there is none"
+        return self._todos[handle]
 
     def get_todos(self):
-        return self._todos
+        return list(self._todos.values())
+
+    @staticmethod
+    def append_to(filename, todos):
+        """appends todos to the end of filename without reading or
+        rewriting the existing lines. the data is fsynced before this
+        returns. if filename is a directory of done shards, the todos
+        go to its current shard."""
+        if os.path.isdir(filename):
+            from todotxt.shards import DoneArchive
+            DoneArchive(filename).append(todos)
+            return
+        data = "".join(str(t) + "\n" for t in todos).encode()
+        with open(filename, 'ab+') as f:
+            before = cache.stat_fingerprint(os.fstat(f.fileno()))
+            offset, st = _append(f, data)
+        prompt.appended(filename, before, cache.stat_fingerprint(st), todos)
+
+    def track_changes(self):
+        """starts keeping the lines that are on disk, so changes made to
+        the file by someone else can be merged, see merge_changes. call
+        it while the todos are as on disk, e.g. right after loading."""
+        self._base = Counter(map(str, self._todos.values()))
+
+    def merge_changes(self):
+        """merges changes someone else made to the file on disk since it
+        was last read or written, if tracking changes. returns (added
+        todos, removed todos), None if the file is unchanged.
+
+        Todos for lines that appeared on disk are added, and todos whose
+        lines disappeared are deleted unless they were changed here as
+        well. Nothing else is touched, so unsaved changes are kept. The
+        next save rewrites the whole file.
+        """
+        if self._base is None or self._on_disk_unchanged():
+            return None
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+            fp = cache.stat_fingerprint(os.fstat(f.fileno()))
+        disk = Counter(str(t) for t in parse_lines(
+            data.decode().splitlines()) if t is not None)
+        gone = self._base - disk
+        removed = []
+        for t in list(self._todos.values()):
+            line = str(t)
+            if gone[line] > 0:
+                gone[line] -= 1
+                self.delete_todo(t)
+                removed.append(t)
+        added = [todo_from_line(line)
+                 for line in (disk - self._base).elements()]
+        for t in added:
+            self.add_todo(t)
+        self._base = disk
+        self._fingerprint = fp
+        self._forget_lines()
+        self._layout_stale = True
+        return added, removed
+
+    def _on_disk_unchanged(self):
+        "True if the file is still the one we last read or wrote"
+        try:
+            return cache.fingerprint(self.filename) == self._fingerprint
+        except FileNotFoundError:
+            return False
 
     def save(self):
+        """writes changes back to the file, if there are any.
+
+        Changed lines that keep their length are patched in place and
+        added todos are appended. If lines were deleted or changed
+        length, the file is rewritten from the first such line on. The
+        whole file is atomically replaced instead if that would rewrite
+        most of it, or if the file was changed by someone else since it
+        was read.
+        """
+        if self._layout_stale or not self._on_disk_unchanged():
+            self._rewrite()
+            return
+
+        size = self._fingerprint[1]
+        patches = []
+        tail_start = size
+        offsets = self._offsets
+        for h in self._lines_on_disk():
+            cur = self._todos.get(h)
+            if cur is not None and cur._rev == self._revs[h]:
+                continue
+            if cur is not None:
+                data = str(cur).encode()
+                if len(data) == self._lengths[h]:
+                    patches.append((h, offsets[h], data))
+                    continue
+            tail_start = min(tail_start, offsets[h])
+
+        tail = [(h, t) for h, t in self._todos.items()
+                if not self._on_disk(h) or offsets[h] >= tail_start]
+        if not patches and not tail and tail_start == size:
+            return
+        if size - tail_start > size // 2:
+            self._rewrite()
+            return
+
+        with open(self.filename, 'r+b') as f:
+            for h, offset, data in patches:
+                if offset < tail_start:
+                    f.seek(offset)
+                    f.write(data)
+                    self._wrote(h, self._todos[h], offset, len(data))
+            if tail and tail_start == size and size > 0:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+                    tail_start += 1
+            f.seek(tail_start)
+            self._write_lines(f, tail, tail_start)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        self._fingerprint = cache.stat_fingerprint(st)
+        self._after_sync()
+
+    def _rewrite(self):
+        "atomically replaces the file with all of our todos"
+        # imported here, it's slow to import and most runs never rewrite
+        import tempfile
         with tempfile.NamedTemporaryFile(
                 dir=os.path.dirname(self.filename),
                 delete=False) as fout:
-            fout.write(str(self).encode())
-            fout.write("\n".encode())
+            self._forget_lines()
+            self._write_lines(fout, self._todos.items(), 0)
+            fout.flush()
+            os.fsync(fout.fileno())
         os.replace(fout.name, self.filename)
+        self._fingerprint = cache.fingerprint(self.filename)
+        self._layout_stale = False
+        self._after_sync()
+
+    def _write_lines(self, f, todos, offset):
+        """writes (handle, todo) pairs to f, which is at offset, and
+        records where each line went."""
+        lines = []
+        for h, t in todos:
+            data = str(t).encode()
+            self._wrote(h, t, offset, len(data))
+            lines.append(data)
+            offset += len(data) + 1
+        if lines:
+            f.write(b"\n".join(lines) + b"\n")
+
+        # forget deleted todos
+        for h in self._lines_on_disk():
+            if h not in self._todos:
+                self._offsets[h] = -1
+
+
+def _append(f, data):
+    """appends data to f, opened in 'ab+' mode, adding a newline first if
+    the file doesn't end with one. fsyncs, then returns the offset data
+    was written at and the new stat result."""
+    offset = f.tell()
+    if offset > 0:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            data = b"\n" + data
+            offset += 1
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    return offset, os.fstat(f.fileno())
@@ -0,0 +1,5 @@
+import sys
+
+from todotxt.cli import main
+
+sys.exit(main())
@@ -0,0 +1,157 @@
+# completion statistics over done todos, computed on columns
+#
+# Done todos are loaded into parallel integer columns (done day, hour,
+# lead time, and project/context membership) and the aggregates are
+# computed over whole columns. Uses numpy if it is installed and the
+# stdlib array module otherwise.
+
+from array import array
+from collections import Counter
+from datetime import date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# marks a missing hour or lead time in the columns
+MISSING = -1
+
+
+class DoneColumns:
+    """Done todos as columns. Row i of each column is the i-th todo.
+
+    day: done date as a proleptic Gregorian ordinal
+    hour: hour it was done, MISSING without a 'done-<TIME>' hashtag
+    lead: days from created_date to done_date, MISSING without a
+          created date
+    project_rows, project_codes: one entry per (todo, project) pair,
+          codes index into project_names. same for contexts.
+    """
+    def __init__(self):
+        self.day = array('l')
+        self.hour = array('l')
+        self.lead = array('l')
+        self.project_rows = array('l')
+        self.project_codes = array('l')
+        self.project_names = []
+        self.context_rows = array('l')
+        self.context_codes = array('l')
+        self.context_names = []
+
+    @classmethod
+    def from_todos(cls, todos):
+        "builds columns from the done todos in the iterable todos"
+        self = cls()
+        project_code = {}
+        context_code = {}
+        # dates repeat a lot, so each date string is converted once
+        ordinals = {None: MISSING}
+        row = 0
+        for t in todos:
+            if not t.done:
+                continue
+            done = ordinals.get(t.done_date)
+            if done is None:
+                done = ordinals[t.done_date] = t.done_datetime.toordinal()
+            created = ordinals.get(t.created_date)
+            if created is None:
+                created = ordinals[t.created_date] = \
+                    t.created_datetime.toordinal()
+            self.day.append(done)
+            timed = any(ht.startswith("done-") for ht in t.hashtags)
+            self.hour.append(t.done_datetime.hour if timed else MISSING)
+            self.lead.append(MISSING if created == MISSING
+                             else done - created)
+            for p in t.projects:
+                self.project_rows.append(row)
+                self.project_codes.append(
+                    _code(project_code, self.project_names, p))
+            for c in t.contexts:
+                self.context_rows.append(row)
+                self.context_codes.append(
+                    _code(context_code, self.context_names, c))
+            row += 1
+        if numpy is not None:
+            for attr in ('day', 'hour', 'lead', 'project_rows',
+                         'project_codes', 'context_rows', 'context_codes'):
+                col = getattr(self, attr)
+                setattr(self, attr, numpy.frombuffer(
+                    col, dtype="i{}".format(col.itemsize)))
+        return self
+
+    def __len__(self):
+        return len(self.day)
+
+    def per_day(self):
+        "returns {date: completions} for each day with completions"
+        if len(self) == 0:
+            return {}
+        if numpy is not None:
+            first = int(self.day.min())
+            counts = numpy.bincount(self.day - first)
+            days = numpy.flatnonzero(counts)
+            return {date.fromordinal(first + int(d)): int(counts[d])
+                    for d in days}
+        return {date.fromordinal(d): n
+                for d, n in sorted(Counter(self.day).items())}
+
+    def per_hour(self):
+        "returns a list of 24 completion counts, one per hour of the day"
+        if numpy is not None:
+            hours = self.hour[self.hour != MISSING]
+            return [int(n) for n in numpy.bincount(hours, minlength=24)]
+        counts = [0] * 24
+        for h in self.hour:
+            if h != MISSING:
+                counts[h] += 1
+        return counts
+
+    def per_project(self):
+        "returns {project: completions}"
+        return _per_code(self.project_codes, self.project_names)
+
+    def per_context(self):
+        "returns {context: completions}"
+        return _per_code(self.context_codes, self.context_names)
+
+    def lead_times(self):
+        """returns (count, mean, median, 90th percentile) of the days from
+        created to done, over todos with a created date. None if there
+        are none."""
+        if numpy is not None:
+            lead = self.lead[self.lead != MISSING]
+            if len(lead) == 0:
+                return None
+            return (len(lead), float(lead.mean()),
+                    float(numpy.median(lead)),
+                    float(numpy.percentile(lead, 90)))
+        lead = sorted(n for n in self.lead if n != MISSING)
+        if len(lead) == 0:
+            return None
+        return (len(lead), sum(lead) / len(lead), _percentile(lead, 50),
+                _percentile(lead, 90))
+
+
+def _code(codes, names, name):
+    code = codes.get(name)
+    if code is None:
+        code = codes[name] = len(names)
+        names.append(name)
+    return code
+
+
+def _per_code(codes, names):
+    if numpy is not None:
+        counts = numpy.bincount(codes, minlength=len(names))
+        return {name: int(n) for name, n in zip(names, counts)}
+    counts = Counter(codes)
+    return {name: counts[i] for i, name in enumerate(names)}
+
+
+def _percentile(values, pct):
+    "linearly interpolated percentile of sorted values, like numpy's"
+    pos = (len(values) - 1) * pct / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
@@ -0,0 +1,76 @@
+# on-disk cache of parsed todo files
+#
+# Caching is off unless $TODOTXT_CACHE_DIR is set (or a cache dir is
+# passed in explicitly). Entries are pickles next to each other in that
+# dir, one per source file and kind, and are only used if the source
+# file's fingerprint (inode, size, mtime) still matches.
+#
+# Like git's index, an entry stored within RACY_NS of the file's mtime is
+# not trusted: the file could have been changed again within the same
+# timestamp tick without its fingerprint changing.
+
+# pickle and tempfile are imported where they're used, since they're slow
+# to import and runs without a cache dir never need them
+import os
+import time
+
+CACHE_VERSION = 3
+RACY_NS = 2 * 10**9
+
+
+def cache_dir():
+    "returns the cache dir from $TODOTXT_CACHE_DIR, None if caching is off"
+    return os.environ.get('TODOTXT_CACHE_DIR') or None
+
+
+def fingerprint(filename):
+    "identifies a version of filename by inode, size and mtime"
+    return stat_fingerprint(os.stat(filename))
+
+
+def stat_fingerprint(st):
+    "like fingerprint, from an os.stat result"
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def cache_path(directory, filename, kind):
+    "returns the path of the 'kind' cache entry for filename in directory"
+    name = os.path.abspath(filename).replace('%', '%25').replace(os.sep, '%')
+    return os.path.join(directory, "{}.{}".format(name, kind))
+
+
+def load(path, fp):
+    """returns the data stored at path if it was stored with fingerprint
+    fp, None otherwise."""
+    import pickle
+    try:
+        with open(path, 'rb') as f:
+            version, stored_fp, stored_ns, data = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError,
+            pickle.UnpicklingError):
+        return None
+    if version != CACHE_VERSION or stored_fp != fp:
+        return None
+    if stored_ns - fp[2] < RACY_NS:
+        return None
+    return data
+
+
+def store(path, fp, data):
+    """atomically writes data to path, tagged with fingerprint fp. errors
+    are ignored, since the cache is only an optimization. nothing is
+    written within RACY_NS of the file's mtime, load would reject it."""
+    if time.time_ns() - fp[2] < RACY_NS:
+        return
+    import pickle
+    import tempfile
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory,
+                                         delete=False) as fout:
+            pickle.dump((CACHE_VERSION, fp, time.time_ns(), data), fout,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(fout.name, path)
+    except OSError:
+        pass
@@ -0,0 +1,105 @@
+# one entry point for the scripts: python -m todotxt <command> [args]
+#
+# Each command runs one of the scripts next to the todotxt package as if
+# it was run directly. Nothing a command needs is imported until it runs,
+# so short commands like add only pay for their own imports. Scripts are
+# compiled and run here rather than through runpy, which would import
+# importlib.util and pkgutil on every start.
+
+import builtins
+import os
+import sys
+import types
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'add': "add.py",
+    'archive': "archive.py",
+    'daemon': "daemon.py",
+    'do': "do.py",
+    'edit': "edit.py",
+    'projects': "projects.py",
+    'prompt': "prompt.py",
+    'query': "query.py",
+    'recap': "recap.py",
+    'review': "review.py",
+}
+
+
+def usage():
+    print("USAGE: python -m todotxt <command> [args]")
+    print("commands: {}, startup".format(", ".join(sorted(COMMANDS))))
+    print("run a command with -h for its arguments")
+
+
+def run(command, args):
+    """runs the script for command with the command line args, as
+    __main__"""
+    path = os.path.join(SCRIPT_DIR, COMMANDS[command])
+    sys.argv = [path] + list(args)
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    with open(path, 'rb') as f:
+        code = compile(f.read(), path, 'exec')
+    module = types.ModuleType('__main__')
+    module.__file__ = path
+    module.__builtins__ = builtins
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = module
+    try:
+        exec(code, module.__dict__)
+    finally:
+        sys.modules['__main__'] = main
+
+
+def startup(args):
+    """times starting each command, or the ones in args, with 'usage' as
+    its argument, which imports everything the command needs and exits.
+    prints the best and median of -n runs (default 10) in ms, through
+    python -m todotxt and running the script directly, next to the time
+    to start python itself."""
+    import statistics
+    import subprocess
+    import time
+
+    runs = 10
+    if args[:1] == ["-n"]:
+        runs = int(args[1])
+        args = args[2:]
+    commands = args or sorted(COMMANDS)
+
+    def time_ms(cmdline):
+        times = []
+        for i in range(runs):
+            start = time.perf_counter()
+            subprocess.run(cmdline, stdout=subprocess.DEVNULL, check=True)
+            times.append((time.perf_counter() - start) * 1000)
+        return min(times), statistics.median(times)
+
+    print("{:<10} {:>8} {:>8} {:>8} {:>8}".format(
+        "command", "-m best", "median", "script", "median"))
+    print("{:<10} {:>8.1f} {:>8.1f}".format(
+        "python", *time_ms([sys.executable, "-c", "pass"])))
+    for c in commands:
+        script = os.path.join(SCRIPT_DIR, COMMANDS[c])
+        times = (time_ms([sys.executable, "-m", "todotxt", c, "usage"]) +
+                 time_ms([sys.executable, script, "usage"]))
+        print("{:<10} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}".format(c, *times))
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) == 0 or args[0] in ("-h", "--help", "usage"):
+        usage()
+        return 0
+    command = args[0]
+    if command == "startup":
+        startup(args[1:])
+    elif command in COMMANDS:
+        run(command, args[1:])
+    else:
+        print("unknown command '{}'".format(command))
+        usage()
+        return 1
+    return 0
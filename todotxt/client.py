@@ -0,0 +1,93 @@
+# talking to a running todotxt daemon, see todotxt.daemon
+#
+# Kept to cheap imports, since the point of asking the daemon is to skip
+# loading and parsing in short-lived scripts.
+#
+# Requests carry the text of todos, so a socket is only talked to if it
+# belongs to this user and sits in a directory others can't put a socket
+# of their own in, see owned().
+
+import json
+import os
+import socket
+import stat
+import zlib
+
+
+def socket_dir():
+    """returns the directory of the default sockets: todotxt-<uid> in
+    $XDG_RUNTIME_DIR or /tmp, which only its user may use"""
+    run_dir = os.environ.get('XDG_RUNTIME_DIR') or "/tmp"
+    return os.path.join(run_dir, "todotxt-{}".format(os.getuid()))
+
+
+def make_socket_dir():
+    """creates socket_dir with mode 0700 if needed. raises OSError if it
+    belongs to someone else or others may write to it."""
+    directory = socket_dir()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        raise OSError("{} is not a private directory".format(directory))
+    return directory
+
+
+def socket_path(todo_dir):
+    """returns the path of the socket the daemon for todo_dir listens on:
+    $TODOTXT_SOCKET if set, otherwise one per directory in
+    socket_dir."""
+    path = os.environ.get('TODOTXT_SOCKET')
+    if path:
+        return path
+    key = zlib.crc32(os.path.realpath(todo_dir).encode())
+    return os.path.join(socket_dir(), "{:08x}.sock".format(key))
+
+
+def owned(path):
+    """returns True if the socket at path belongs to this user, and the
+    directory it is in can't be written by other users (or is sticky,
+    like /tmp), so no one else can have replaced it."""
+    uid = os.getuid()
+    try:
+        st = os.lstat(path)
+        dir_st = os.stat(os.path.dirname(path) or ".")
+    except FileNotFoundError:
+        return False
+    if st.st_uid != uid or not stat.S_ISSOCK(st.st_mode):
+        return False
+    return (dir_st.st_mode & stat.S_ISVTX != 0 or
+            dir_st.st_uid in (uid, 0) and not dir_st.st_mode & 0o022)
+
+
+def request(todo_dir, msg, timeout=10.0, path=None):
+    """sends msg, a dict with an 'op' key, to the daemon for todo_dir and
+    returns its reply, a dict with 'ok' and either the results or an
+    'error' message.
+
+    returns None if no daemon is running, or its socket isn't owned, so
+    the caller can fall back to reading the files itself. once the
+    request is sent, errors are raised instead, since the daemon may
+    have acted on it. path overrides the socket_path.
+    """
+    path = path or socket_path(todo_dir)
+    if not owned(path):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        try:
+            s.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        s.sendall(json.dumps(msg).encode() + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            data = s.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        s.close()
+    return json.loads(b"".join(chunks))
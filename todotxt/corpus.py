@@ -0,0 +1,95 @@
+# synthetic todo directories for benchmarking
+#
+# generate() writes a todo directory that looks like a real one that has
+# been in use for a while: most lines are in done.txt, done in date order
+# as archive appends them, and the rest are spread over todo.txt and the
+# other files review knows about. The same arguments always give the
+# same files.
+
+from datetime import date, timedelta
+import os
+import random
+
+# share of the lines in each file
+FILES = (("done.txt", 0.6), ("todo.txt", 0.2), ("someday-maybe.txt", 0.1),
+         ("next-week.txt", 0.05), ("waiting.txt", 0.05))
+
+WORDS = ("call email buy fix write read review plan book schedule pay "
+         "clean check order send update draft finish sort print ask "
+         "mom bank car bike report taxes garden invoice slides dentist "
+         "groceries backup website notes budget tickets flights").split()
+
+
+class Mix:
+    """how often each part of a todo appears: priorities is the share of
+    undone todos with one (A-C, A rarest), created the share with a
+    created date, timed the share of those that also have a
+    #created-<TIME> hashtag, hashtags the share with another hashtag,
+    done the share of todos outside done.txt that are done but not
+    archived yet. each todo has 0-2 of nprojects projects and 0-2 of
+    ncontexts contexts."""
+    def __init__(self, priorities=0.3, created=0.7, timed=0.5, hashtags=0.1,
+                 done=0.05, nprojects=50, ncontexts=8):
+        self.priorities = priorities
+        self.created = created
+        self.timed = timed
+        self.hashtags = hashtags
+        self.done = done
+        self.nprojects = nprojects
+        self.ncontexts = ncontexts
+
+
+def _line(rng, mix, day, done_day=None):
+    parts = []
+    if done_day is not None:
+        parts += ["x", done_day.isoformat()]
+    elif rng.random() < mix.priorities:
+        parts.append("({})".format(rng.choice("AABBBCCCC")))
+    created = rng.random() < mix.created
+    if created:
+        parts.append(day.isoformat())
+    parts += rng.sample(WORDS, rng.randint(2, 6))
+    parts += ["+proj{}".format(rng.randrange(mix.nprojects))
+              for i in range(rng.choice((0, 1, 1, 1, 2)))]
+    parts += ["@ctx{}".format(rng.randrange(mix.ncontexts))
+              for i in range(rng.choice((0, 1, 1, 2)))]
+    if rng.random() < mix.hashtags:
+        parts.append("#tag{}".format(rng.randrange(20)))
+    if created and rng.random() < mix.timed:
+        parts.append("#created-{:02}:{:02}:{:02}".format(
+            rng.randrange(24), rng.randrange(60), rng.randrange(60)))
+    if done_day is not None:
+        parts.append("#done-{:02}:{:02}:{:02}".format(
+            rng.randrange(7, 23), rng.randrange(60), rng.randrange(60)))
+    return " ".join(parts)
+
+
+def generate(todo_dir, lines, seed=0, mix=None, start=date(2015, 1, 1)):
+    """writes about lines todo lines across the files in FILES into
+    todo_dir, which is created if needed. returns {filename: number of
+    lines}."""
+    rng = random.Random(seed)
+    mix = mix or Mix()
+    os.makedirs(todo_dir, exist_ok=True)
+    counts = {}
+    # done todos not archived yet were done in the last week of done.txt
+    last_done = start + timedelta(
+        days=max(int(lines * dict(FILES)["done.txt"]) // 20, 1) - 1)
+    for filename, share in FILES:
+        n = int(lines * share)
+        # about 20 todos done a day
+        days = max(n // 20, 1)
+        with open(os.path.join(todo_dir, filename), 'w') as f:
+            for i in range(n):
+                day = start + timedelta(days=i * days // max(n, 1))
+                if filename == "done.txt":
+                    created = day - timedelta(days=rng.randrange(30))
+                    f.write(_line(rng, mix, created, done_day=day) + "\n")
+                else:
+                    done_day = None
+                    if rng.random() < mix.done:
+                        done_day = max(day, last_done - timedelta(
+                            days=rng.randrange(7)))
+                    f.write(_line(rng, mix, day, done_day) + "\n")
+        counts[filename] = n
+    return counts
@@ -0,0 +1,163 @@
+# a resident process that keeps a todo directory parsed
+#
+# The daemon loads the todo files once and answers queries and mutations
+# from short-lived scripts over a Unix socket (see todotxt.client), so
+# they don't pay for parsing on every run. Requests and replies are one
+# JSON object per connection. Requests are handled one at a time, so
+# mutations don't race each other.
+#
+# Before each request, and every POLL_SECONDS while idle, files that
+# changed on disk are dropped and read again, so edits made by other
+# programs are picked up.
+
+import json
+import os
+import socketserver
+
+from todotxt import journal, todo_from_line
+from todotxt.client import make_socket_dir, owned, request, socket_dir, \
+    socket_path
+from todotxt.query import Query
+from todotxt.store import TodoStore
+
+POLL_SECONDS = 1.0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            reply = self.server.dispatch(json.loads(self.rfile.readline()))
+        except Exception as e:
+            # a bad request shouldn't take the daemon down
+            reply = {'ok': False, 'error': "{}: {}".format(
+                type(e).__name__, e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class TodoDaemon(socketserver.UnixStreamServer):
+    """Serves the todo files in todo_dir on a Unix socket, at path or
+    the default from todotxt.client.socket_path.
+
+    Each 'op' of a request is handled by the op_<name> method, which
+    gets the rest of the request as keyword arguments.
+    """
+    timeout = POLL_SECONDS
+
+    def __init__(self, todo_dir, path=None, cache_dir=None):
+        self.todo_dir = todo_dir
+        self.path = path or socket_path(todo_dir)
+        self._stopping = False
+        if os.path.dirname(self.path) == socket_dir():
+            make_socket_dir()
+        if os.path.lexists(self.path):
+            if not owned(self.path):
+                raise OSError("{} belongs to someone else, or is in a "
+                              "directory others can write to".format(
+                                  self.path))
+            if running(todo_dir, self.path) is not None:
+                raise OSError("a daemon is already listening on " +
+                              self.path)
+            # left behind by a daemon that was killed
+            os.unlink(self.path)
+        self.store = TodoStore(todo_dir, cache_dir)
+        self.store.preload([n for n in self.store if n != "done.txt"], 1)
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def serve(self):
+        "handles requests until a 'stop' request comes in"
+        try:
+            while not self._stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            os.unlink(self.path)
+
+    def handle_timeout(self):
+        # no lock while idle: a file read while it's being saved is
+        # forgotten by the refresh before the next request
+        journal.Journal(self.todo_dir).maybe_compact()
+        self.refresh()
+
+    def refresh(self):
+        """forgets files that changed on disk and reads the ones that
+        were loaded again, so the next request finds them parsed. call
+        it holding journal.locked before writing, which applies changes
+        journaled by other writers once there are enough of them."""
+        for name in self.store.refresh():
+            if name in self.store:
+                self.store[name]
+
+    def dispatch(self, msg):
+        # the files are only written while the journal is locked, from
+        # the refresh up to the reply, so compaction can't interleave.
+        # journaled changes are left for compaction until there are
+        # enough of them, like journaled writers do
+        with journal.locked(self.todo_dir, apply=False):
+            self.refresh()
+            op = getattr(self, "op_" + str(msg.pop('op', None)), None)
+            if op is None:
+                return {'ok': False, 'error': "unknown op"}
+            reply = op(**msg)
+        reply['ok'] = reply.get('ok', True)
+        return reply
+
+    def op_ping(self):
+        return {'pid': os.getpid(), 'dir': self.todo_dir}
+
+    def op_stop(self):
+        self._stopping = True
+        return {}
+
+    def op_query(self, created=(None, None), completed=(None, None),
+                 **conditions):
+        """runs a todotxt.query.Query, replies with {name: {'total': number
+        of todos, 'matches': [[handle, line], ...]}}"""
+        q = Query(created=tuple(created), completed=tuple(completed),
+                  **conditions)
+        results = {}
+        for name, matches in q.run(self.store).items():
+            results[name] = {'total': self.store.total(name),
+                             'matches': [[h, str(t)] for h, t in matches]}
+        return {'results': results}
+
+    def op_add(self, file, text, created_now=False):
+        "appends a todo parsed from text to file, like add.py"
+        t = todo_from_line(text)
+        if created_now:
+            t.set_created_now()
+        handle = self.store[file].append_todo(t)
+        return {'handle': handle, 'todo': str(t)}
+
+    def op_do(self, file, handles):
+        """marks the todos with handles in file done and saves it, like
+        do.py. nothing is changed if any of them is missing or done
+        already."""
+        todo_file = self.store[file]
+        todos = []
+        for h in handles:
+            try:
+                t = todo_file.get_todo(h)
+            except KeyError:
+                return {'ok': False, 'missing': h,
+                        'todos': [str(t) for t in todo_file.get_todos()]}
+            if t.done:
+                return {'ok': False, 'already_done': h}
+            todos.append(t)
+        for t in todos:
+            t.done = True
+            todo_file.replace_todo(t, t)
+        todo_file.save()
+        return {'done': [str(t) for t in todos]}
+
+
+def running(todo_dir, path=None):
+    "returns the pid of the daemon serving todo_dir, None if there is none"
+    try:
+        reply = request(todo_dir, {'op': 'ping'}, timeout=1.0, path=path)
+    except (OSError, ValueError):
+        return None
+    return reply and reply['pid']
@@ -0,0 +1,242 @@
+# a write-ahead journal of changes to the todo files in a directory
+#
+# Instead of loading and saving a todo file, a writer can append a small
+# record of its change to .journal in the directory and return. Appends
+# are serialized with flock on .journal.lock, and made durable with group
+# commit: the fsync is done under a second lock, and a writer whose
+# record was already covered by someone else's fsync doesn't fsync again.
+#
+# Now and then (see COMPACT_BYTES and COMPACT_SECONDS) a writer compacts
+# the journal: it moves .journal aside, so writers can go on appending to
+# a new one, applies the records to the todo files and deletes it. If
+# compaction is interrupted, the next one applies the leftover records
+# first; todos added just before the interruption can then be added
+# twice.
+#
+# Compaction loads and saves the todo files like any other writer, so
+# scripts that write them directly do so under locked(), which holds the
+# compaction lock: no compaction runs between their reading a file and
+# saving it, and they never save over one another.
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import time
+
+from todotxt import TODOFile, todo_from_line
+
+JOURNAL = ".journal"
+COMPACT_BYTES = 64 * 2**10
+COMPACT_SECONDS = 60
+
+
+class _Flock:
+    "an exclusive flock on path, as a context manager"
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        flags = fcntl.LOCK_EX if self.blocking else \
+            fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self.fd, flags)
+        except BlockingIOError:
+            os.close(self.fd)
+            self.fd = None
+        return self.fd
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            os.close(self.fd)
+
+
+class Journal:
+    "the journal of the todo files in todo_dir"
+    def __init__(self, todo_dir):
+        self.todo_dir = todo_dir
+        self.path = os.path.join(todo_dir, JOURNAL)
+
+    def _file(self, suffix):
+        return self.path + suffix
+
+    def add(self, filename, todo):
+        "records that todo is to be appended to filename, a basename"
+        self.append({'op': 'add', 'file': filename, 'line': str(todo)})
+
+    def replace(self, filename, handle, old, new):
+        """records that the todo old, at line handle of filename, is to be
+        replaced with the todo new. old is looked up by its text if it
+        moved, and the record is dropped if it's gone."""
+        self.append({'op': 'replace', 'file': filename, 'handle': handle,
+                     'line': str(old), 'new': str(new)})
+
+    def append(self, record):
+        "durably appends record, a dict with an 'op', to the journal"
+        record['time'] = time.time()
+        data = (json.dumps(record) + "\n").encode()
+        with _Flock(self._file(".lock")):
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o600)
+            os.write(fd, data)
+            st = os.fstat(fd)
+        try:
+            self._commit(fd, st.st_ino, st.st_size)
+        finally:
+            os.close(fd)
+
+    def _commit(self, fd, ino, end):
+        """makes sure the journal with inode ino is on disk up to end.
+        .journal.sync holds how far the last fsync got, so writers that
+        queued up behind an fsync that already covered their record are
+        done without one of their own. compaction empties it, since the
+        next journal can get the same inode."""
+        with _Flock(self._file(".sync")) as sync_fd:
+            synced = os.pread(sync_fd, 64, 0).split()
+            if synced and int(synced[0]) == ino and int(synced[1]) >= end:
+                return
+            st = os.fstat(fd)
+            os.fsync(fd)
+            # moved aside for compaction meanwhile: don't vouch for
+            # whatever journal is created next
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if not os.path.samestat(st, current):
+                return
+            data = "{} {}\n".format(ino, st.st_size).encode()
+            os.pwrite(sync_fd, data.ljust(64), 0)
+
+    def pending(self):
+        "returns the records not compacted yet, in order"
+        return (_read_records(self._file(".compacting")) +
+                _read_records(self.path))
+
+    def should_compact(self):
+        "True if the journal is big or old enough to compact"
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_size >= COMPACT_BYTES:
+            return True
+        with open(self.path, 'rb') as f:
+            first = _parse_record(f.readline())
+        return first is not None and \
+            time.time() - first['time'] >= COMPACT_SECONDS
+
+    def maybe_compact(self):
+        """compacts if should_compact says so and no one else is
+        compacting right now"""
+        if self.should_compact():
+            self.compact(blocking=False)
+
+    def compact(self, blocking=True):
+        """applies the journal to the todo files and empties it. returns
+        the number of records applied, None if someone else was
+        compacting and blocking is False."""
+        with _Flock(self._file(".compact"), blocking) as fd:
+            if fd is None:
+                return None
+            return self._compact_locked()
+
+    def _compact_locked(self):
+        "compacts, with the compaction lock already held"
+        compacting = self._file(".compacting")
+        # left over from an interrupted compaction
+        n = self._apply(compacting)
+        with _Flock(self._file(".lock")):
+            if not os.path.exists(self.path):
+                return n
+            os.replace(self.path, compacting)
+            # the next journal may reuse the inode, with a smaller size
+            with _Flock(self._file(".sync")) as sync_fd:
+                os.ftruncate(sync_fd, 0)
+        return n + self._apply(compacting)
+
+    def _apply(self, path):
+        records = _read_records(path)
+        by_file = {}
+        for r in records:
+            by_file.setdefault(r['file'], []).append(r)
+        for filename, file_records in by_file.items():
+            path_txt = os.path.join(self.todo_dir, filename)
+            if not os.path.exists(path_txt):
+                open(path_txt, 'a').close()
+            f = TODOFile(path_txt)
+            added = []
+            for r in file_records:
+                if r['op'] == 'add':
+                    added.append(todo_from_line(r['line']))
+                elif r['op'] == 'replace':
+                    _apply_replace(f, added, r)
+            f.save()
+            f.append_todos(added)
+        if os.path.exists(path):
+            os.unlink(path)
+        return len(records)
+
+
+def _apply_replace(f, added, record):
+    """applies a replace record to the TODOFile f, or to added, the todos
+    added by earlier records that aren't in f yet"""
+    try:
+        t = f.get_todo(record['handle'])
+    except KeyError:
+        t = None
+    if t is None or str(t) != record['line']:
+        t = next((t for t in f.get_todos() if str(t) == record['line']),
+                 None)
+    if t is not None:
+        f.replace_todo(t, todo_from_line(record['new']))
+        return
+    for i, t in enumerate(added):
+        if str(t) == record['line']:
+            added[i] = todo_from_line(record['new'])
+            return
+
+
+def _parse_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        # a record torn by a crash mid-write
+        return None
+
+
+def _read_records(path):
+    try:
+        with open(path, 'rb') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    return [r for r in map(_parse_record, lines) if r is not None]
+
+
+def compact(todo_dir):
+    """applies the journal of todo_dir, if there is one, so the todo
+    files are up to date"""
+    j = Journal(todo_dir)
+    if os.path.exists(j.path) or os.path.exists(j._file(".compacting")):
+        j.compact()
+
+
+@contextmanager
+def locked(todo_dir, apply=True):
+    """holds the compaction lock of todo_dir's journal, for writing the
+    todo files directly: wrap everything from reading a file to saving
+    it. waiting records are applied first, so the files are up to date
+    when read. journaled writers can go on appending meanwhile.
+
+    With apply False, the records are only applied if should_compact
+    says so, for long running writers that don't need to see them yet.
+    """
+    j = Journal(todo_dir)
+    with _Flock(j._file(".compact")):
+        if os.path.exists(j._file(".compacting")) or \
+                (os.path.exists(j.path) if apply else j.should_compact()):
+            j._compact_locked()
+        yield
@@ -0,0 +1,115 @@
+# parallel loading of todo files across a process pool
+#
+# concurrent.futures is imported only once a pool is started: it pulls in
+# multiprocessing, which would slow down every serial load.
+
+import mmap
+import os
+import sys
+
+from todotxt import TODOFile, cache, gc_paused, _parse_line, _todo_fields, \
+    _make_todo
+
+# below this many bytes in total, starting a pool costs more than it saves
+MIN_PARALLEL_BYTES = 4 * 2**20
+# files are parsed in chunks of about this many bytes
+CHUNK_BYTES = 2 * 2**20
+
+
+def _parse_chunk(filename, start, end):
+    """parses the lines in bytes [start, end) of filename, which must start
+    and end on line boundaries.
+
+    returns (number of lines, [(line number in chunk, offset, length,
+    todo fields), ...])
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    records = []
+    offset = start
+    n = 0
+    with gc_paused():
+        for n, raw in enumerate(data.splitlines(True), 1):
+            line = raw.decode()
+            t = _parse_line(line)
+            if t is not None:
+                records.append((n, offset,
+                                len(line.rstrip("\r\n").encode()),
+                                _todo_fields(t)))
+            offset += len(raw)
+    return n, records
+
+
+def _chunk_bounds(filename, size):
+    "returns [(start, end), ...] covering filename, split after newlines"
+    if size <= CHUNK_BYTES:
+        return [(0, size)]
+    bounds = []
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            start = 0
+            while start < size:
+                end = m.find(b"\n", start + CHUNK_BYTES) + 1
+                if end == 0:
+                    end = size
+                bounds.append((start, end))
+                start = end
+    return bounds
+
+
+def _intern_fields(fields):
+    "re-interns tags and dates that were unpickled from a worker"
+    intern = sys.intern
+    text, prio, created, done, cx, prj, ht = fields
+    return (text, prio,
+            created and intern(created), done and intern(done),
+            tuple(map(intern, cx)) if cx else (),
+            tuple(map(intern, prj)) if prj else (),
+            tuple(map(intern, ht)) if ht else ())
+
+
+def load_files(filenames, jobs=None, cache_dir=None):
+    """returns {filename: TODOFile} for filenames, parsing them, and
+    chunks of large ones, in parallel across jobs processes (default:
+    one per CPU).
+
+    Files that can be loaded from the cache are, and if the rest add up
+    to less than MIN_PARALLEL_BYTES, or jobs is 1, they are simply
+    loaded one after another.
+    """
+    files = {}
+    to_parse = []
+    for fn in filenames:
+        f = TODOFile.from_cache(fn, cache_dir)
+        if f is not None:
+            files[fn] = f
+        else:
+            to_parse.append((fn, cache.fingerprint(fn)))
+
+    total = sum(fp[1] for fn, fp in to_parse)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or total < MIN_PARALLEL_BYTES:
+        for fn, fp in to_parse:
+            files[fn] = TODOFile(fn, cache_dir)
+        return files
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [(fn, fp, [pool.submit(_parse_chunk, fn, start, end)
+                             for start, end in _chunk_bounds(fn, fp[1])])
+                   for fn, fp in to_parse]
+        for fn, fp, chunk_futures in futures:
+            records = []
+            base = 0
+            with gc_paused():
+                for future in chunk_futures:
+                    nlines, chunk_records = future.result()
+                    for n, offset, length, fields in chunk_records:
+                        records.append((base + n, offset, length,
+                                        _make_todo(*_intern_fields(fields))))
+                    base += nlines
+            files[fn] = TODOFile.from_records(fn, fp, base + 1, records,
+                                              cache_dir)
+    return files
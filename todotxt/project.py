@@ -2,11 +2,17 @@
 
 from collections import defaultdict
 from functools import total_ordering
-from glob import glob
+import json
 import os
 import tempfile
+import time
 
-from todotxt import TODOFile
+from todotxt import cache
+from todotxt.shards import DoneArchive, done_path
+from todotxt.store import TodoStore
+
+# bumped when the saved counts change shape
+COUNTS_VERSION = 1
 
 @total_ordering
 class Project:
@@ -14,23 +20,29 @@ class Project:
         "todos is a dictionary {filename: list of Todos}"
         self.name = name
         self.description = description if description else ""
-        self.todos = defaultdict(list)
+        # only counts are kept, that is all the metadata needs
+        self.counts = defaultdict(int)
         if todos:
-            self.todos.update(todos)
+            for fn, tl in todos.items():
+                self.add_todos(fn, tl)
         self.sortorder = ['todo.txt', 'next-week.txt', 'waiting.txt',
                           'someday-maybe.txt', 'done.txt']
 
     def add_todos(self, todo_filename, todos):
         "adds a list of todos from todo_filename "
-        self.todos[todo_filename] += todos
+        self.add_count(todo_filename, len(todos))
+
+    def add_count(self, todo_filename, count):
+        "adds count todos from todo_filename"
+        self.counts[todo_filename] += count
 
     def metadata_str(self, pad_char=" "):
         sa = []
         for fn in self.sortorder:
-            tl = self.todos[fn]
-            if len(tl) > 0:
+            n = self.counts[fn]
+            if n > 0:
                 sa.append("{}:{:2}".format(fn[:-4], # remove .txt
-                                            len(tl)))
+                                            n))
             else:
                 sa.append(pad_char * (len(fn[:-4]) + 3))
         return " ".join(sa)
@@ -38,7 +50,7 @@ class Project:
     def _get_sort_tuple(self, p):
         t = []
         for fn in p.sortorder:
-            t.append(len(p.todos[fn]))
+            t.append(p.counts[fn])
         t.append(p.name)
         t.append(p.description)
         return tuple(t)
@@ -96,8 +108,15 @@ class ProjectFile:
     on save, so externally added comments will not be preserved.
 
     """
-    def __init__(self, filename):
+    def __init__(self, filename, store=None, jobs=1):
+        """store is the TodoStore to count todos in, by default one for
+        the directory filename is in. files that need parsing are parsed
+        across jobs processes, see todotxt.parallel."""
         self.filename = filename
+        self.jobs = jobs
+        if store is None:
+            store = TodoStore(os.path.dirname(self.filename))
+        self.store = store
         self.orphan_projectname = "no-project"
         self._projects = {}
         if os.path.exists(self.filename):
@@ -107,26 +126,118 @@ class ProjectFile:
                     if p is not None:
                         self._projects[p.name] = p
 
-        self._todo_files = {}
         self._recalc()
         
     def _recalc(self):
-        self._todos = defaultdict(list)
-        todo_dir = os.path.dirname(self.filename)
-        todo_filenames = glob(todo_dir + "/*.txt")
-        for fn in todo_filenames:
-            bfn = os.path.basename(fn)
-            tf = TODOFile(fn)
-            for project_name, project_todos in tf.projects.items():
-                p = self._projects.setdefault(project_name,
-                                              Project(project_name))
-                p.add_todos(bfn, project_todos)
-
-            op = self._projects.setdefault(self.orphan_projectname,
-                                          Project(self.orphan_projectname,
-                                                  "Todos with no project"))
-            op.add_todos(bfn, [t for t in tf.get_todos()
-                               if len(t.projects) == 0])
+        # files someone else loaded may have unsaved changes, so their
+        # counts are neither read from nor written to the saved counts
+        self._loaded_elsewhere = set(self.store.loaded())
+        saved = self._load_counts()
+        entries = {}
+        counts = {}
+        for bfn in self.store:
+            entry = self._current_entry(bfn, saved.get(bfn))
+            if entry is not None:
+                entries[bfn] = entry
+                counts[bfn] = (entry['projects'], entry['orphans'])
+            elif bfn in self._loaded_elsewhere and bfn in saved:
+                # still good for the next run if the file isn't changed
+                entries[bfn] = saved[bfn]
+        stale = [bfn for bfn in self.store if bfn not in counts]
+        if self.jobs != 1 and len(stale) > 0:
+            self.store.preload(stale, self.jobs)
+
+        for bfn in stale:
+            fp = cache.fingerprint(self.store.path(bfn))
+            counts[bfn] = self._file_counts(bfn)
+            if bfn not in self._loaded_elsewhere:
+                entries[bfn] = {'fingerprint': list(fp),
+                                'stored': time.time_ns(),
+                                'projects': counts[bfn][0],
+                                'orphans': counts[bfn][1]}
+        for bfn in self.store:
+            self._add_counts(bfn, counts[bfn])
+        if entries != saved:
+            self._save_counts(entries)
+
+        # done shards count as done.txt, straight from their manifest
+        shard_dir = done_path(self.store.todo_dir)
+        if os.path.isdir(shard_dir):
+            self._add_counts("done.txt",
+                             DoneArchive(shard_dir).project_counts())
+
+    def _add_counts(self, bfn, counts):
+        project_counts, orphan_count = counts
+        for project_name, count in project_counts.items():
+            p = self._projects.setdefault(project_name,
+                                          Project(project_name))
+            p.add_count(bfn, count)
+
+        op = self._projects.setdefault(self.orphan_projectname,
+                                      Project(self.orphan_projectname,
+                                              "Todos with no project"))
+        op.add_count(bfn, orphan_count)
+
+    def counts_path(self):
+        """returns where the per-file counts are saved between runs: next
+        to filename as .<name>.counts, or in the cache dir if caching is
+        on (see todotxt.cache)."""
+        cache_dir = self.store.cache_dir or cache.cache_dir()
+        if cache_dir:
+            return cache.cache_path(cache_dir, self.filename, 'counts')
+        head, tail = os.path.split(self.filename)
+        return os.path.join(head, ".{}.counts".format(tail))
+
+    def _load_counts(self):
+        try:
+            with open(self.counts_path()) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(saved, dict) or \
+                saved.get('version') != COUNTS_VERSION:
+            return {}
+        return saved['files']
+
+    def _save_counts(self, entries):
+        "atomically writes the counts file. errors are ignored."
+        path = self.counts_path()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    'w', dir=os.path.dirname(path) or ".",
+                    delete=False) as fout:
+                json.dump({'version': COUNTS_VERSION, 'files': entries},
+                          fout)
+            os.replace(fout.name, path)
+        except OSError:
+            pass
+
+    def _current_entry(self, bfn, entry):
+        """returns the saved counts entry for bfn if it's still current,
+        None if bfn has to be counted again. like the cache, an entry
+        saved within cache.RACY_NS of the file's mtime isn't trusted."""
+        if entry is None or bfn in self._loaded_elsewhere:
+            return None
+        try:
+            fp = cache.fingerprint(self.store.path(bfn))
+        except FileNotFoundError:
+            return None
+        if entry.get('fingerprint') != list(fp) or \
+                entry.get('stored', 0) - fp[2] < cache.RACY_NS:
+            return None
+        return entry
+
+    def _file_counts(self, bfn):
+        """returns ({project name: count}, count of todos with no project)
+        for the todo file bfn.
+
+        The counts are saved per file (see counts_path), so only files
+        that changed since the last run are parsed again.
+        """
+        tf = self.store[bfn]
+        return ({name: len(todos) for name, todos in tf.projects.items()},
+                len([t for t in tf.get_todos() if len(t.projects) == 0]))
 
     def __str__(self):
         return self.padded_string(120)
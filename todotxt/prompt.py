@@ -0,0 +1,174 @@
+# a small precomputed view of the priority A todos in todo.txt
+#
+# Shell prompts show the (A) todos, optionally only those in a focus
+# context, on every prompt. Rather than parse todo.txt each time, TODOFile
+# keeps .todo.txt.prompt next to it up to date whenever it loads, saves
+# or appends to todo.txt. The view has one line per (A) todo that isn't
+# done, with its line number and contexts, under a header with the
+# fingerprint (see todotxt.cache) and line count of the todo.txt it was
+# made from. If todo.txt was changed by something else, the fingerprint
+# won't match and the view is rebuilt from todo.txt.
+
+import os
+
+from todotxt import cache
+
+VIEW_FILES = ("todo.txt",)
+PRIORITY = "A"
+HEADER = "todotxt-prompt 1"
+
+
+def view_path(filename):
+    "returns the path of the view for filename"
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, "." + basename + ".prompt")
+
+
+def has_view(filename):
+    "True if filename is one of the files views are kept for"
+    return os.path.basename(filename) in VIEW_FILES
+
+
+def _wanted(t):
+    return t.priority == PRIORITY and not t.done
+
+
+def _entry(n, t):
+    return (n, t.contexts, str(t))
+
+
+def read(filename):
+    """returns (fingerprint, line count, [(line number, contexts, line),
+    ...]) from the view of filename, None if there is none."""
+    try:
+        with open(view_path(filename), 'r') as f:
+            header = f.readline().split()
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    if " ".join(header[:2]) != HEADER or len(header) != 6:
+        return None
+    fp = tuple(int(v) for v in header[2:5])
+    entries = []
+    for line in lines:
+        n, contexts, text = line.split("\t", 2)
+        entries.append((int(n), tuple(contexts.split()), text))
+    return fp, int(header[5]), entries
+
+
+def write(filename, fp, nlines, entries):
+    """atomically replaces the view of filename. errors are ignored, the
+    view is rebuilt when it's next read."""
+    # imported here, prompts that only read the view never need it
+    import tempfile
+    path = view_path(filename)
+    try:
+        with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(path) or ".", prefix=".",
+                delete=False) as f:
+            f.write("{} {} {} {} {}\n".format(HEADER, *fp, nlines))
+            for n, contexts, text in entries:
+                f.write("{}\t{}\t{}\n".format(n, " ".join(contexts), text))
+        os.replace(f.name, path)
+    except OSError:
+        pass
+
+
+def _build(todo_file):
+    "returns (line count, entries) of the view for todo_file"
+    offsets = todo_file._offsets
+    wanted = sorted((offsets[h], t) for h, t in todo_file._todos.items()
+                    if _wanted(t))
+    # handles stop being line numbers once lines are deleted, so the
+    # line numbers come from the offsets the todos were written at
+    with open(todo_file.filename, 'rb') as f:
+        data = f.read()
+    entries = []
+    n = 1
+    pos = 0
+    for offset, t in wanted:
+        n += data.count(b"\n", pos, offset)
+        pos = offset
+        entries.append(_entry(n, t))
+    nlines = data.count(b"\n") + (not data.endswith(b"\n") and len(data) > 0)
+    return nlines, entries
+
+
+def update(todo_file):
+    """rebuilds the view of todo_file, a TODOFile whose todos are all
+    in sync with the file on disk, unless it is current already."""
+    if not has_view(todo_file.filename):
+        return
+    view = read(todo_file.filename)
+    if view is not None and view[0] == todo_file._fingerprint:
+        return
+    write(todo_file.filename, todo_file._fingerprint, *_build(todo_file))
+
+
+def appended(filename, before, after, todos):
+    """updates the view of filename after todos were appended to it as
+    new lines, changing its fingerprint from before to after. the view
+    is left alone, to be rebuilt later, if it wasn't current."""
+    if not has_view(filename):
+        return
+    view = read(filename)
+    if view is None or view[0] != before:
+        return
+    fp, nlines, entries = view
+    entries += [_entry(nlines + i, t) for i, t in enumerate(todos, 1)
+                if _wanted(t)]
+    write(filename, after, nlines + len(todos), entries)
+
+
+def _overlay(filename, nlines, entries, records):
+    """returns entries with the journal records for filename applied, see
+    todotxt.journal: added todos get the line numbers they'll have once
+    appended, replaced ones keep theirs."""
+    from todotxt import todo_from_line
+    basename = os.path.basename(filename)
+    entries = list(entries)
+    added = {}
+    for r in records:
+        if r['file'] != basename:
+            continue
+        if r['op'] == 'add':
+            nlines += 1
+            n = added[r['line']] = nlines
+        elif r['op'] == 'replace':
+            old = next((e for e in entries if e[2] == r['line']), None)
+            if old is not None:
+                entries.remove(old)
+            n = added.get(r['line'], old[0] if old else r['handle'])
+        else:
+            continue
+        t = todo_from_line(r.get('new', r['line']))
+        if _wanted(t):
+            entries.append(_entry(n, t))
+    return sorted(entries, key=lambda e: e[0])
+
+
+def prompt_lines(filename, context=None, pending=()):
+    """returns [(line number, line), ...] of the (A) todos in filename,
+    only those in context if one is given. pending are journal records
+    not applied to filename yet, they're shown as if they were.
+
+    Only the view is read if it is current, otherwise filename is loaded
+    and the view rebuilt.
+    """
+    try:
+        fp = cache.fingerprint(filename)
+    except FileNotFoundError:
+        return []
+    view = read(filename)
+    if view is not None and view[0] == fp:
+        nlines, entries = view[1:]
+    else:
+        from todotxt import TODOFile
+        f = TODOFile(filename)
+        nlines, entries = _build(f)
+        # loading it from the cache doesn't, so the view is written here
+        write(filename, f._fingerprint, nlines, entries)
+    if pending:
+        entries = _overlay(filename, nlines, entries, pending)
+    return [(n, text) for n, contexts, text in entries
+            if context is None or context in contexts]
@@ -0,0 +1,133 @@
+# filtering todos across files using the TODOFile indexes
+
+from todotxt import TODOFile
+
+
+class Query:
+    """A filter over todos. All given conditions have to hold.
+
+    priorities is a string or set of priority letters, projects,
+    contexts and hashtags are names that all have to be present. done
+    is True or False to only match done or not done todos. files
+    restricts the files searched to those basenames. created and
+    completed are (first, last) date string ranges, either end may be
+    None for an open range.
+    """
+    def __init__(self, priorities=None, projects=(), contexts=(),
+                 hashtags=(), done=None, files=None,
+                 created=(None, None), completed=(None, None)):
+        self.priorities = set(priorities) if priorities else None
+        self.projects = tuple(projects)
+        self.contexts = tuple(contexts)
+        self.hashtags = tuple(hashtags)
+        self.done = done
+        self.files = files
+        self.created = created
+        self.completed = completed
+
+    def _tag_conditions(self):
+        return ([('projects', p) for p in self.projects] +
+                [('contexts', c) for c in self.contexts] +
+                [('hashtags', h) for h in self.hashtags])
+
+    def _date_conditions(self):
+        return [(attr, r) for attr, r in (('created_date', self.created),
+                                           ('done_date', self.completed))
+                if r != (None, None)]
+
+    def plan(self, todo_file):
+        """returns (candidate todos, tag conditions left to check) for
+        todo_file.
+
+        Candidates come from whichever index gives the fewest todos: the
+        smallest matching tag bucket, or a date range from the sorted
+        date indexes. The date indexes are only built for a query
+        without tag conditions, otherwise they're only used if they
+        already exist. With no usable index, all todos are candidates.
+        """
+        conditions = self._tag_conditions()
+        sources = []
+        for c in conditions:
+            attr, name = c
+            bucket = getattr(todo_file, attr).get(name, [])
+            sources.append((len(bucket), lambda b=bucket: b, c))
+        if len(conditions) == 0 or todo_file.date_indexed:
+            for attr, (first, last) in self._date_conditions():
+                n = todo_file.count_by_date(attr, first, last)
+                sources.append((n, lambda a=attr, f=first, l=last:
+                                todo_file.todos_by_date(a, f, l), None))
+        if len(sources) == 0:
+            return todo_file.get_todos(), []
+        n, candidates, used = min(sources, key=lambda s: s[0])
+        return candidates(), [c for c in conditions if c is not used]
+
+    def match(self, todo, conditions=None):
+        "returns True if todo matches, checking tag conditions given"
+        if conditions is None:
+            conditions = self._tag_conditions()
+        if self.done is not None and todo.done != self.done:
+            return False
+        if (self.priorities is not None and
+                todo.priority not in self.priorities):
+            return False
+        if not _in_range(todo.created_date, self.created):
+            return False
+        if not _in_range(todo.done_date, self.completed):
+            return False
+        for attr, name in conditions:
+            if name not in getattr(todo, attr):
+                return False
+        return True
+
+    def run_file(self, todo_file):
+        "returns [(handle, todo), ...] of matches in todo_file"
+        candidates, conditions = self.plan(todo_file)
+        matches = {}
+        for t in candidates:
+            # a todo is in a bucket twice if it names a tag twice
+            if id(t) not in matches and self.match(t, conditions):
+                matches[id(t)] = (todo_file.handle_of(t), t)
+        matches = list(matches.values())
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+    def run_archive(self, archive):
+        """returns [(number, todo), ...] of matches in a DoneArchive. its
+        todos are numbered from 1 across the shards, oldest first, and
+        only shards that may hold todos done in the completed range are
+        read."""
+        wanted = set(archive.shards_between(*self.completed))
+        matches = []
+        n = 0
+        for name in archive.shards():
+            if name not in wanted:
+                n += archive.entry(name)['count']
+                continue
+            for t in TODOFile.iter_todos(archive.path(name)):
+                n += 1
+                if self.match(t):
+                    matches.append((n, t))
+        return matches
+
+    def run(self, store):
+        """returns {filename: [(handle, todo), ...]} of matches in the
+        files of a TodoStore. if the store's done todos are in shards,
+        they are searched as done.txt."""
+        names = [n for n in store if self.files is None or n in self.files]
+        results = {n: self.run_file(store[n]) for n in names}
+        if "done.txt" not in store and \
+                (self.files is None or "done.txt" in self.files):
+            archive = store.done_archive()
+            if archive is not None:
+                results["done.txt"] = self.run_archive(archive)
+        return results
+
+
+def _in_range(date, date_range):
+    first, last = date_range
+    if first is None and last is None:
+        return True
+    if date is None:
+        return False
+    return ((first is None or date >= first) and
+            (last is None or date <= last))
@@ -0,0 +1,225 @@
+# done todos archived into monthly shards
+#
+# Instead of one ever-growing done.txt, a todo directory can keep its done
+# todos in done/YYYY-MM.txt, one file per month they were archived in, plus
+# done/manifest.json holding each shard's todo count, done date range and
+# project counts. Archiving only appends to the current month's shard, and
+# readers use the manifest to pick the shards they need.
+#
+# A shard is only re-read to update its manifest entry when its inode,
+# size or mtime no longer match the ones recorded, e.g. after an edit.
+
+# tempfile is imported where it's used, since it's slow to import and
+# only needed when the manifest changes
+from datetime import date
+from glob import glob
+import json
+import os
+
+from todotxt import TODOFile, cache, _append
+
+DONE_DIR = "done"
+MANIFEST = "manifest.json"
+SHARD_FMT = "%Y-%m"
+
+
+def done_path(todo_dir):
+    """returns the done archive of todo_dir: the shard directory if there
+    is one, done.txt otherwise. TODOFile.iter_todos, tail_done and
+    append_to accept either."""
+    shard_dir = os.path.join(todo_dir, DONE_DIR)
+    if os.path.isdir(shard_dir):
+        return shard_dir
+    return os.path.join(todo_dir, "done.txt")
+
+
+def _shard_stats(todos):
+    "returns a manifest entry, without fingerprint, for todos"
+    done_dates = [t.done_date for t in todos if t.done_date]
+    projects = {}
+    orphans = 0
+    for t in todos:
+        for p in t.projects:
+            projects[p] = projects.get(p, 0) + 1
+        if len(t.projects) == 0:
+            orphans += 1
+    return {'count': len(todos),
+            'first': min(done_dates) if done_dates else None,
+            'last': max(done_dates) if done_dates else None,
+            'projects': projects,
+            'orphans': orphans}
+
+
+def _merge_stats(entry, stats):
+    "adds the counts and date range of stats into the manifest entry"
+    entry['count'] += stats['count']
+    for end, pick in (('first', min), ('last', max)):
+        dates = [d for d in (entry[end], stats[end]) if d]
+        entry[end] = pick(dates) if dates else None
+    for p, n in stats['projects'].items():
+        entry['projects'][p] = entry['projects'].get(p, 0) + n
+    entry['orphans'] += stats['orphans']
+
+
+class DoneArchive:
+    """The monthly shards in shard_dir, read and appended to as one
+    logical done file.
+
+    The manifest is brought up to date with the shards on disk when the
+    archive is opened, re-reading only shards that changed.
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self._manifest_path = os.path.join(shard_dir, MANIFEST)
+        try:
+            with open(self._manifest_path, 'r') as f:
+                self._manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._manifest = {}
+        self._refresh()
+
+    def _refresh(self):
+        on_disk = {os.path.basename(fn) for fn in
+                   glob(os.path.join(self.shard_dir, "*.txt"))}
+        changed = False
+        for name in list(self._manifest):
+            if name not in on_disk:
+                del self._manifest[name]
+                changed = True
+        for name in sorted(on_disk):
+            fp = list(cache.fingerprint(self.path(name)))
+            entry = self._manifest.get(name)
+            if entry is None or entry['fingerprint'] != fp:
+                entry = _shard_stats(list(TODOFile.iter_todos(
+                    self.path(name))))
+                entry['fingerprint'] = fp
+                self._manifest[name] = entry
+                changed = True
+        if changed:
+            self._save_manifest()
+
+    def _save_manifest(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile('w', dir=self.shard_dir,
+                                         delete=False) as fout:
+            json.dump(self._manifest, fout, indent=1, sort_keys=True)
+        os.replace(fout.name, self._manifest_path)
+
+    def path(self, name):
+        return os.path.join(self.shard_dir, name)
+
+    def shards(self):
+        "returns the shard names, oldest first"
+        return sorted(self._manifest)
+
+    def entry(self, name):
+        """returns the manifest entry of shard name: a dict of 'count',
+        'first' and 'last' done date, 'projects' {name: count},
+        'orphans' (todos without a project) and 'fingerprint'."""
+        return self._manifest[name]
+
+    def __len__(self):
+        return sum(e['count'] for e in self._manifest.values())
+
+    def shards_between(self, first=None, last=None):
+        """returns the names of the shards that may hold todos done
+        between the date strings first and last, inclusive. shards
+        without any done dates are always included."""
+        names = []
+        for name in self.shards():
+            e = self._manifest[name]
+            if (e['first'] is None or
+                    (first is None or e['last'] >= first) and
+                    (last is None or e['first'] <= last)):
+                names.append(name)
+        return names
+
+    def iter_todos(self, predicate=None, first=None, last=None):
+        """yields the todos in the shards that may hold todos done between
+        first and last, shard by shard. like TODOFile.iter_todos, it
+        doesn't load whole shards and skips todos that predicate returns
+        False for. it does not filter by date itself."""
+        for name in self.shards_between(first, last):
+            yield from TODOFile.iter_todos(self.path(name), predicate)
+
+    def tail_done(self, ndays):
+        """like TODOFile.tail_done, across the shards. shards are read
+        newest first, each only from its end, and the rest are skipped
+        once they were all done before the last ndays dates found."""
+        by_last = sorted((e['last'] or "", name)
+                         for name, e in self._manifest.items())
+        tails = {}
+        dates = set()
+        cutoff = None
+        for shard_last, name in reversed(by_last):
+            if cutoff is not None and shard_last < cutoff:
+                break
+            # any of the overall last ndays dates that are in this shard
+            # are among its own last ndays dates
+            tails[name] = TODOFile.tail_done(self.path(name), ndays)
+            dates.update(t.done_date for t in tails[name])
+            if len(dates) >= ndays:
+                cutoff = sorted(dates)[-ndays]
+        todos = []
+        for name in sorted(tails):
+            todos += [t for t in tails[name]
+                      if cutoff is None or t.done_date >= cutoff]
+        return todos
+
+    def current_shard(self):
+        "returns the name of the shard todos archived today go to"
+        return date.today().strftime(SHARD_FMT) + ".txt"
+
+    def append(self, todos):
+        """appends todos to the current shard, like TODOFile.append_to,
+        and updates its manifest entry without re-reading it."""
+        todos = list(todos)
+        if len(todos) == 0:
+            return
+        name = self.current_shard()
+        entry = self._manifest.get(name)
+        data = "".join(str(t) + "\n" for t in todos).encode()
+        with open(self.path(name), 'ab+') as f:
+            offset, st = _append(f, data)
+        if entry is None or offset != entry['fingerprint'][1]:
+            # new shard, or someone else changed it since we looked
+            entry = _shard_stats(list(TODOFile.iter_todos(self.path(name))))
+            self._manifest[name] = entry
+        else:
+            _merge_stats(entry, _shard_stats(todos))
+        entry['fingerprint'] = list(cache.stat_fingerprint(st))
+        self._save_manifest()
+
+    def project_counts(self):
+        """returns ({project name: count}, count of todos with no project)
+        over all shards, from the manifest."""
+        projects = {}
+        orphans = 0
+        for e in self._manifest.values():
+            for p, n in e['projects'].items():
+                projects[p] = projects.get(p, 0) + n
+            orphans += e['orphans']
+        return projects, orphans
+
+
+def split_done(todo_dir):
+    """moves the todos of todo_dir's done.txt into monthly shards by done
+    date, undated ones into the current month's shard. done.txt is kept
+    as done.txt.split, out of the way of the *.txt files. returns the
+    DoneArchive. if there is no done.txt, e.g. because it was split
+    already, the shards are left as they are."""
+    done_filename = os.path.join(todo_dir, "done.txt")
+    shard_dir = os.path.join(todo_dir, DONE_DIR)
+    if not os.path.exists(done_filename):
+        os.makedirs(shard_dir, exist_ok=True)
+        return DoneArchive(shard_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+    current = date.today().strftime(SHARD_FMT) + ".txt"
+    shards = {}
+    for t in TODOFile.iter_todos(done_filename):
+        name = t.done_date[:7] + ".txt" if t.done_date else current
+        shards.setdefault(name, []).append(t)
+    for name, todos in shards.items():
+        TODOFile.append_to(os.path.join(shard_dir, name), todos)
+    os.replace(done_filename, done_filename + ".split")
+    return DoneArchive(shard_dir)
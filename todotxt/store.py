@@ -0,0 +1,158 @@
+# lazily loaded todo files of a directory
+
+from collections import defaultdict
+from collections.abc import Mapping
+from glob import glob
+from operator import attrgetter
+import os
+
+from todotxt import TODOFile
+from todotxt.shards import DoneArchive, done_path
+
+
+class TodoStore(Mapping):
+    """The *.txt todo files in a directory, as a mapping from basename to
+    TODOFile.
+
+    A file is only read the first time it is looked up, so iterating
+    names or checking membership is free. Code that shares a store
+    shares the parsed files and their changes. With track_changes, files
+    are loaded tracking changes, see TODOFile.merge_changes.
+    """
+    def __init__(self, todo_dir, cache_dir=None, track_changes=False):
+        self.todo_dir = todo_dir
+        self.cache_dir = cache_dir
+        self.track_changes = track_changes
+        self._names = sorted(os.path.basename(fn) for fn in
+                             glob(os.path.join(todo_dir, "*.txt")))
+        self._name_set = set(self._names)
+        self._files = {}
+
+    def __getitem__(self, name):
+        f = self._files.get(name)
+        if f is None:
+            if name not in self._name_set:
+                raise KeyError(name)
+            f = TODOFile(self.path(name), self.cache_dir)
+            if self.track_changes:
+                f.track_changes()
+            self._files[name] = f
+        return f
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._name_set
+
+    def path(self, name):
+        return os.path.join(self.todo_dir, name)
+
+    def preload(self, names=None, jobs=None):
+        """loads the files in names (default: all of them) that aren't
+        loaded yet, in parallel across jobs processes. see
+        todotxt.parallel.load_files."""
+        from todotxt.parallel import load_files
+        names = [n for n in (self._names if names is None else names)
+                 if n not in self._files]
+        files = load_files([self.path(n) for n in names], jobs,
+                           self.cache_dir)
+        for n in names:
+            self._files[n] = files[self.path(n)]
+            if self.track_changes:
+                self._files[n].track_changes()
+
+    def done_archive(self):
+        """returns the DoneArchive of the directory's done shards, None if
+        its done todos are in done.txt. see todotxt.shards."""
+        path = done_path(self.todo_dir)
+        if os.path.isdir(path):
+            return DoneArchive(path)
+        return None
+
+    def total(self, name):
+        """returns the number of todos in the file name. done.txt counts
+        the todos in the done shards if there are any."""
+        if name not in self and name == "done.txt":
+            archive = self.done_archive()
+            if archive is not None:
+                return len(archive)
+        return len(self[name].get_todos())
+
+    def archive_done(self, done_name="done.txt"):
+        """moves the done todos of all other files to the end of
+        done_name, in done date order. returns {name: number of todos
+        archived}.
+
+        Each file is partitioned in one pass, all done todos are
+        appended to done_name with one write, and each file that had
+        done todos is saved once. done_name is not read unless it was
+        already loaded. If done_name is done.txt and the directory has
+        a done/ shard directory instead, the todos go to its current
+        shard, see todotxt.shards.
+        """
+        archived = {}
+        done_todos = []
+        for name in self._names:
+            if name == done_name:
+                continue
+            todos = self[name].remove_done()
+            archived[name] = len(todos)
+            done_todos += todos
+        # in done date order, which TODOFile.tail_done relies on. a
+        # stable sort on the date strings, like tail_done compares, so
+        # malformed dates don't stop the archive
+        done_todos.sort(key=attrgetter('done_date'))
+
+        if done_name in self._files:
+            self._files[done_name].append_todos(done_todos)
+        elif done_name == "done.txt":
+            TODOFile.append_to(done_path(self.todo_dir), done_todos)
+        else:
+            TODOFile.append_to(self.path(done_name), done_todos)
+        for name, n in archived.items():
+            if n > 0:
+                self[name].save()
+        return archived
+
+    def refresh(self):
+        """picks up *.txt files added to or removed from the directory,
+        and forgets loaded files that changed on disk since they were
+        read or saved, so they're read again when next looked up.
+        returns the names of the files forgotten."""
+        self._names = sorted(os.path.basename(fn) for fn in
+                             glob(os.path.join(self.todo_dir, "*.txt")))
+        self._name_set = set(self._names)
+        stale = [name for name, f in self._files.items()
+                 if name not in self._name_set or
+                 not f._on_disk_unchanged()]
+        for name in stale:
+            del self._files[name]
+        return stale
+
+    def loaded(self):
+        "returns {name: TODOFile} for the files read so far"
+        return dict(self._files)
+
+    def _merged_index(self, attr, names):
+        index = defaultdict(list)
+        for name in self._names if names is None else names:
+            for key, todos in getattr(self[name], attr).items():
+                index[key] += [(name, t) for t in todos]
+        return index
+
+    def projects(self, names=None):
+        """returns {project: [(filename, todo), ...]} across the files in
+        names, or all files. built from the per-file indexes."""
+        return self._merged_index('projects', names)
+
+    def contexts(self, names=None):
+        "like projects, for contexts"
+        return self._merged_index('contexts', names)
+
+    def hashtags(self, names=None):
+        "like projects, for hashtags"
+        return self._merged_index('hashtags', names)
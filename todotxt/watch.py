@@ -0,0 +1,104 @@
+# noticing todo files that change on disk
+#
+# watch(directory) returns a watcher whose changed() gives the names of
+# the *.txt files in directory that were written, replaced, created or
+# deleted since the last call. On Linux it uses inotify through ctypes,
+# so checking costs one non-blocking read; elsewhere it falls back to
+# comparing each file's os.stat fingerprint.
+#
+# Watchers report our own writes too, so callers should check whether a
+# file really changed, e.g. with TODOFile.merge_changes.
+
+from glob import glob
+import os
+import struct
+
+from todotxt import cache
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct("iIII")
+
+
+def _txt_names(directory):
+    return {os.path.basename(fn) for fn in
+            glob(os.path.join(directory, "*.txt"))}
+
+
+class InotifyWatcher:
+    "a watcher using Linux's inotify"
+    def __init__(self, directory):
+        import ctypes
+        self.directory = directory
+        libc = ctypes.CDLL(None, use_errno=True)
+        # raises AttributeError where there is no inotify
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                IN_CREATE | IN_DELETE)
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed", directory)
+
+    def changed(self):
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost, so anything could have changed
+                    names |= _txt_names(self.directory)
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                names.add(os.fsdecode(name))
+        return {n for n in names if n.endswith(".txt")}
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher:
+    "a watcher comparing stat fingerprints, for where inotify isn't there"
+    def __init__(self, directory):
+        self.directory = directory
+        self._fingerprints = self._scan()
+
+    def _scan(self):
+        fps = {}
+        for name in _txt_names(self.directory):
+            try:
+                fps[name] = cache.fingerprint(os.path.join(self.directory,
+                                                           name))
+            except FileNotFoundError:
+                pass
+        return fps
+
+    def changed(self):
+        old = self._fingerprints
+        self._fingerprints = self._scan()
+        return {n for n in set(old) | set(self._fingerprints)
+                if old.get(n) != self._fingerprints.get(n)}
+
+    def close(self):
+        pass
+
+
+def watch(directory):
+    "returns an InotifyWatcher for directory if possible, a PollWatcher if not"
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError):
+        return PollWatcher(directory)